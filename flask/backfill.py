@@ -0,0 +1,226 @@
+"""
+Offline backfill: structure stored documents without going through HTTP.
+
+    python backfill.py ../back/uploads/attestations --output attestations.jsonl
+    python backfill.py scans/ --mode id-card --workers 4 --output id_cards.jsonl
+
+carte-grise mode runs extract_text_from_image on every image/PDF under the
+directory. id-card mode pairs files whose names differ only by "front" /
+"back" (e.g. 42-front.jpg, 42-back.jpg) and parses them with read_id_card
+(template OCR plus IDCardProcessor). Results are appended to the JSONL output
+as they complete; the sha256 of every successfully processed document is
+appended to the checkpoint file, so an interrupted run resumes where it
+stopped and re-runs only new or failed documents.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from content_cache import content_hash, file_hash
+
+logger = logging.getLogger('backfill')
+
+EXTENSIONS = ('.png', '.jpg', '.jpeg', '.pdf')
+SIDE_PATTERN = re.compile(r'(front|back)', re.IGNORECASE)
+
+# The service module, imported once per worker process
+_service = None
+
+
+def _init_worker():
+    """Import the service in each worker with an in-process OCR model"""
+    global _service
+    # Each backfill worker is already its own process; a nested OCR pool per
+    # worker would only multiply the loaded models
+    os.environ['OCR_WORKERS'] = '0'
+    import main
+    _service = main
+
+
+def process_document(mode, paths):
+    """Structure one document (a file, or a front/back pair) and return its result"""
+    if _service is None:
+        _init_worker()
+    from uploaded_file import UploadedFile
+
+    uploads = [UploadedFile.from_path(path) for path in paths]
+    if mode == 'id-card':
+        return _service.read_id_card(*uploads)
+    return _service.extract_text_from_image(uploads[0])
+
+
+def _timed(mode, paths):
+    start = time.perf_counter()
+    result = process_document(mode, paths)
+    return result, time.perf_counter() - start
+
+
+def find_documents(directory, mode):
+    """Return [paths] per document under directory, in a stable order"""
+    files = []
+    for root, _, names in sorted(os.walk(directory)):
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in EXTENSIONS:
+                files.append(os.path.join(root, name))
+
+    if mode != 'id-card':
+        return [[path] for path in files]
+
+    sides = {}
+    for path in files:
+        name = os.path.basename(path)
+        match = SIDE_PATTERN.search(name)
+        if not match:
+            continue
+        key = (os.path.dirname(path), name[:match.start()], os.path.splitext(name[match.end():])[0])
+        sides.setdefault(key, {})[match.group(1).lower()] = path
+
+    documents = []
+    for key in sorted(sides):
+        pair = sides[key]
+        if 'front' in pair and 'back' in pair:
+            documents.append([pair['front'], pair['back']])
+        else:
+            logger.warning(f"Skipping unpaired ID card side: {next(iter(pair.values()))}")
+    return documents
+
+
+def document_hash(paths):
+    """sha256 of the document contents; pairs hash the two file digests together"""
+    digests = [file_hash(path) for path in paths]
+    if len(digests) == 1:
+        return digests[0]
+    return content_hash(':'.join(digests).encode('utf-8'))
+
+
+def load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, encoding='utf-8') as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+class Progress:
+    """Log throughput and an ETA at most every interval seconds"""
+
+    def __init__(self, total, interval=10):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+        self._last_report = self.started
+
+    def update(self, failed=False):
+        self.done += 1
+        self.failed += int(failed)
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval or self.done == self.total:
+            self._last_report = now
+            self.report()
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else float('inf')
+        logger.info(f"{self.done}/{self.total} documents ({self.failed} failed), "
+                    f"{rate:.2f} docs/s, {rate * 60:.0f} docs/min, ETA {eta:.0f}s")
+
+
+def run(args):
+    documents = find_documents(args.directory, args.mode)
+    completed = load_checkpoint(args.checkpoint)
+
+    pending = []
+    for paths in documents:
+        digest = document_hash(paths)
+        if digest not in completed:
+            pending.append((digest, paths))
+            # Duplicate uploads of the same document are processed once
+            completed.add(digest)
+
+    logger.info(f"{len(documents)} documents found, {len(pending)} left to process")
+    if not pending:
+        return 0
+
+    progress = Progress(len(pending), args.report_every)
+    with open(args.output, 'a', encoding='utf-8') as output, \
+            open(args.checkpoint, 'a', encoding='utf-8') as checkpoint:
+
+        def record(digest, paths, result=None, seconds=None, error=None):
+            entry = {'sha256': digest, 'mode': args.mode, 'paths': paths}
+            if error is None:
+                entry.update(result=result, seconds=round(seconds, 3))
+            else:
+                entry['error'] = error
+            output.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+            output.flush()
+            # Only successes are checkpointed, so failures are retried next run
+            if error is None:
+                checkpoint.write(digest + '\n')
+                checkpoint.flush()
+            progress.update(failed=error is not None)
+
+        if args.workers <= 0:
+            for digest, paths in pending:
+                try:
+                    result, seconds = _timed(args.mode, paths)
+                    record(digest, paths, result, seconds)
+                except Exception as e:
+                    logger.error(f"Failed on {paths}: {str(e)}")
+                    record(digest, paths, error=str(e))
+            return 1 if progress.failed else 0
+
+        # Spawned workers re-import main cleanly; at most 2 documents per
+        # worker are in flight so memory stays flat on large trees
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=context,
+                                 initializer=_init_worker) as executor:
+            queue = iter(pending)
+            in_flight = {}
+
+            def fill():
+                while len(in_flight) < args.workers * 2:
+                    item = next(queue, None)
+                    if item is None:
+                        return
+                    in_flight[executor.submit(_timed, args.mode, item[1])] = item
+
+            fill()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    digest, paths = in_flight.pop(future)
+                    try:
+                        result, seconds = future.result()
+                        record(digest, paths, result, seconds)
+                    except Exception as e:
+                        logger.error(f"Failed on {paths}: {str(e)}")
+                        record(digest, paths, error=str(e))
+                fill()
+
+    return 1 if progress.failed else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Structure stored carte grise / ID card scans offline')
+    parser.add_argument('directory', help='Directory tree to scan for images and PDFs')
+    parser.add_argument('--mode', choices=('carte-grise', 'id-card'), default='carte-grise')
+    parser.add_argument('--output', default='backfill.jsonl', help='JSONL file results are appended to')
+    parser.add_argument('--checkpoint', help='File of completed document hashes (default: <output>.done)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes, each with its own OCR model (0 = in this process)')
+    parser.add_argument('--report-every', type=float, default=10, help='Seconds between progress reports')
+    args = parser.parse_args(argv)
+    args.checkpoint = args.checkpoint or f"{args.output}.done"
+    return args
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(run(parse_args()))
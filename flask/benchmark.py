@@ -0,0 +1,537 @@
+"""
+Benchmarks for the vision service.
+
+    python benchmark.py --output results.json
+    python benchmark.py --only face,e2e --baseline results.json --output new.json
+
+Every benchmark runs one operation over its fixtures (the images and PDFs
+under back/uploads plus a few synthetic ones) and reports throughput,
+p50/p95/p99 latency and, for one extra pass, the peak RSS of the process
+and its OCR workers (sampled, Linux only) next to the peak Python/numpy
+memory seen by tracemalloc, which misses native PaddleOCR and dlib memory.
+The back/uploads documents carry no faces, so the face benchmarks only run
+on the photos of --face-fixtures:
+
+    python benchmark.py --face-fixtures ~/faces --only face,e2e_compare_faces
+Isolated benchmarks call FaceComparator, the PDF pipeline, the OCR engine
+and IDCardProcessor directly; e2e benchmarks go through the Flask test
+client. Caches are cleared before every call unless --warm-cache is given.
+
+    python benchmark.py --only profiles --profiles legacy,mobile,server --labels labels.json
+
+--profiles compares OCR profiles (see ocr_profiles.py): for each one the
+carte grise documents and front/back ID card pairs are read and parsed as
+the service does, reporting latency next to how many fields the parsers
+extracted. With --labels (a JSON object mapping a document's file name, or
+an ID card's front file name, to its expected {field: value}) it also
+reports the share of labelled fields read exactly.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+import cv2
+import numpy as np
+
+logger = logging.getLogger('benchmark')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FIXTURES = os.path.join(HERE, '..', 'back', 'uploads')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def load_fixtures(directory, limit):
+    """Return {'images': [(name, bytes)], 'pdfs': [(name, bytes)]}, at most limit of each"""
+    fixtures = {'images': [], 'pdfs': []}
+    for root, _, files in sorted(os.walk(directory)):
+        for filename in sorted(files):
+            extension = os.path.splitext(filename)[1].lower()
+            kind = 'pdfs' if extension == '.pdf' else 'images' if extension in IMAGE_EXTENSIONS else None
+            if kind is None or len(fixtures[kind]) >= limit:
+                continue
+            with open(os.path.join(root, filename), 'rb') as f:
+                fixtures[kind].append((filename, f.read()))
+    return fixtures
+
+
+def synthetic_carte_grise():
+    """A rendered carte grise-like page, so OCR and pairing always have text to find"""
+    image = np.full((700, 1000, 3), 255, dtype=np.uint8)
+    rows = [
+        ("Marque", "RENAULT"), ("Genre", "VP"), ("Modele", "CLIO"),
+        ("Numero d'immatriculation", "12345-A-6"), ("Type carburant", "DIESEL"),
+        ("N du chassis", "VF1RJA00123456789"), ("Adresse", "12 RUE ALLAL BEN ABDELLAH CASABLANCA"),
+        ("Fin de validite", "01.01.2030")
+    ]
+    for index, (label, value) in enumerate(rows):
+        y = 70 + index * 80
+        cv2.putText(image, label, (40, y), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 0), 2)
+        cv2.putText(image, value, (520, y), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 0), 2)
+    return 'synthetic-carte-grise.png', cv2.imencode('.png', image)[1].tobytes()
+
+
+def synthetic_id_lines():
+    """OCR-style (front, back) lines of a Moroccan CNIE"""
+    front = ["ROYAUME DU MAROC", "CARTE NATIONALE D'IDENTITE", "AHMED", "BENANI",
+             "Ne le 01.02.1990", "01.02.1990", "a CASABLANCA", "Valable jusqu'au",
+             "03.04.2031", "BE123456"]
+    back = ["Fils de MOHAMED", "et de FATIMA", "123/1990", "Adresse 12 RUE ALLAL BEN ABDELLAH", "Sexe M"]
+    return ([{"order": i, "text": t} for i, t in enumerate(front, 1)],
+            [{"order": i, "text": t} for i, t in enumerate(back, 1)])
+
+
+def percentile(sorted_values, q):
+    """Linear-interpolated percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def process_tree_rss():
+    """Current RSS in bytes of this process plus its direct children (the OCR workers), or None off Linux"""
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    parent = os.getpid()
+    total = 0
+    try:
+        entries = [entry for entry in os.listdir('/proc') if entry.isdigit()]
+    except OSError:
+        return None
+
+    for entry in entries:
+        try:
+            if int(entry) != parent:
+                with open(f"/proc/{entry}/stat") as f:
+                    # Fields after the parenthesized command name: state, ppid, ...
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) != parent:
+                        continue
+            with open(f"/proc/{entry}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, ValueError, IndexError):
+            # The process exited while being read
+            continue
+    return total
+
+
+def sample_peak_rss(fn, interval=0.01):
+    """Run fn() while sampling process_tree_rss; return the highest sample, or None off Linux"""
+    peak = process_tree_rss()
+    if peak is None:
+        fn()
+        return None
+
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.wait(interval):
+            peak = max(peak, process_tree_rss() or 0)
+
+    sampler = threading.Thread(target=sample, name='rss-sampler', daemon=True)
+    sampler.start()
+    try:
+        fn()
+    finally:
+        done.set()
+        sampler.join()
+    return max(peak, process_tree_rss() or 0)
+
+
+def run_benchmark(cases, fn, iterations, warmup, before_each=None):
+    """
+    Time fn(case) for every case, iterations times, after warmup untimed passes.
+    Raises RuntimeError when every timed call failed, since there is nothing to report.
+    """
+    def call(case):
+        if before_each:
+            before_each()
+        fn(case)
+
+    for _ in range(warmup):
+        for case in cases:
+            try:
+                call(case)
+            except Exception:
+                pass
+
+    durations = []
+    errors = 0
+    last_error = None
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for case in cases:
+            start = time.perf_counter()
+            try:
+                call(case)
+            except Exception as e:
+                errors += 1
+                last_error = e
+                logger.debug(f"Benchmark case failed: {str(e)}")
+                continue
+            durations.append(time.perf_counter() - start)
+    wall = time.perf_counter() - started
+
+    if errors and not durations:
+        raise RuntimeError(f"all {errors} calls failed, last error: {last_error!r}")
+
+    def measured_pass():
+        for case in cases:
+            try:
+                call(case)
+            except Exception:
+                pass
+
+    # One extra pass for memory, kept out of the timings
+    tracemalloc.start()
+    peak_rss = sample_peak_rss(measured_pass)
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    durations.sort()
+    to_ms = lambda seconds: round(seconds * 1000, 3) if seconds is not None else None
+    return {
+        'cases': len(cases),
+        'calls': len(durations) + errors,
+        'errors': errors,
+        'throughput_per_s': round(len(durations) / wall, 3) if wall > 0 else None,
+        'mean_ms': to_ms(sum(durations) / len(durations)) if durations else None,
+        'p50_ms': to_ms(percentile(durations, 50)),
+        'p95_ms': to_ms(percentile(durations, 95)),
+        'p99_ms': to_ms(percentile(durations, 99)),
+        'max_ms': to_ms(durations[-1]) if durations else None,
+        'peak_rss_bytes': peak_rss,
+        'peak_traced_python_bytes': peak_traced
+    }
+
+
+def isolated_benchmarks(fixtures, args):
+    """Yield (name, group, cases, fn, before_each) for the component benchmarks"""
+    import fitz
+    from face_comparator import FaceComparator
+    from uploaded_file import UploadedFile
+    from pdf_pipeline import render_page, text_layer_boxes
+    from id_processor import IDCardProcessor
+
+    images = fixtures['images']
+    faces = fixtures['faces']
+    pdfs = fixtures['pdfs']
+    # A fresh UploadedFile per call so the decoded image is never reused
+    upload = lambda case: UploadedFile(case[0], data=case[1])
+
+    comparator = FaceComparator(encoding_cache=None)
+    # Both take the decoded RGB array, so decoding is part of each call as in the service
+    yield 'face_detection', 'face', faces, lambda case: comparator.detect_face(comparator.load_image(upload(case))), None
+    yield ('face_encoding', 'face', faces,
+           lambda case: comparator.extract_face_encoding(comparator.load_image(upload(case))), None)
+    pairs = list(zip(faces, faces[1:] + faces[:1]))
+    yield 'face_comparison', 'face', pairs, lambda pair: comparator.compare_faces(upload(pair[0]), upload(pair[1])), None
+
+    pages = []
+    for name, data in pdfs:
+        with fitz.open(stream=data, filetype='pdf') as document:
+            pages.extend((name, data, number) for number in range(document.page_count))
+
+    def render(case):
+        with fitz.open(stream=case[1], filetype='pdf') as document:
+            render_page(document[case[2]], args.dpi)
+
+    def text_layer(case):
+        with fitz.open(stream=case[1], filetype='pdf') as document:
+            text_layer_boxes(document[case[2]])
+
+    yield 'pdf_render', 'pdf', pages, render, None
+    yield 'pdf_text_layer', 'pdf', pages, text_layer, None
+
+    front, back = synthetic_id_lines()
+    processor = IDCardProcessor()
+    yield 'id_parse', 'parse', [(front, back)] * 100, lambda case: processor.process_id_card(*case), None
+
+    if args.skip_ocr:
+        return
+
+    # The pool starts on first use, inside the warmup passes
+    pool, engine = profile_engine(args.profile, args)
+    try:
+        ocr_images = images + [synthetic_carte_grise()]
+        yield 'ocr_image', 'ocr', ocr_images, lambda case: engine.recognize_image(upload(case)), None
+        yield 'ocr_pdf', 'ocr', pdfs, lambda case: list(engine.iter_pdf_boxes(upload(case))), None
+    finally:
+        pool.shutdown()
+
+
+def profile_engine(name, args):
+    """An uncached OCR pool and engine for one OCR profile"""
+    from ocr_pool import OCRWorkerPool
+    from ocr_engine import OCREngine
+    from ocr_profiles import load_profile
+
+    profile = load_profile(name)
+    pool = OCRWorkerPool(profile.model_kwargs, workers=args.ocr_workers, call_kwargs=profile.call_kwargs)
+    engine = OCREngine(pool, cache=None, dpi=args.dpi, window=max(args.ocr_workers, 1),
+                       angle_retry_confidence=profile.angle_retry_confidence)
+    return pool, engine
+
+
+def _normalize(value):
+    return ' '.join(str(value or '').upper().split())
+
+
+def _label_accuracy(results, labels):
+    """Share of labelled fields whose extracted value matches exactly (after normalizing case/spaces)"""
+    matched = total = 0
+    for name, values in results:
+        for field, expected in labels.get(name, {}).items():
+            total += 1
+            matched += int(_normalize(values.get(field)) == _normalize(expected))
+    return round(matched / total, 4) if total else None
+
+
+def profile_benchmarks(fixtures, args):
+    """
+    Yield (name, group, cases, fn, before_each, accuracy) per OCR profile for
+    carte grise reading and ID card parsing, with the accuracy measured on an
+    untimed first pass (which also loads the model).
+    """
+    if not args.profiles:
+        return
+
+    import main as service
+    from backfill import find_documents
+    from uploaded_file import UploadedFile
+
+    labels = {}
+    if args.labels:
+        with open(args.labels, encoding='utf-8') as f:
+            labels = json.load(f)
+
+    id_pairs = [paths for paths in find_documents(args.fixtures, 'id-card')
+                if not any(path.lower().endswith('.pdf') for path in paths)][:args.max_fixtures]
+    id_files = {os.path.basename(path) for paths in id_pairs for path in paths}
+    documents = [case for case in fixtures['images'] + fixtures['pdfs'] if case[0] not in id_files]
+    documents.append(synthetic_carte_grise())
+    upload = lambda case: UploadedFile(case[0], data=case[1])
+
+    for name in args.profiles.split(','):
+        pool, engine = profile_engine(name, args)
+
+        # The service's own read paths (including the ID card full-detection
+        # retry), only with this profile's engine
+        def read_carte_grise(case):
+            return service.read_carte_grise(upload(case), engine=engine)[0]
+
+        def read_id_card(paths):
+            return service.read_id_card(*[UploadedFile.from_path(path) for path in paths], engine=engine)
+
+        try:
+            found = [read_carte_grise(case) for case in documents]
+            fields = len(service.CARTE_GRISE_FIELDS)
+            yield (f"carte_grise@{name}", 'profiles', documents, read_carte_grise, None, {
+                'fields_found_rate': round(sum(sum(v is not None for v in s.values()) for s in found)
+                                           / (fields * len(found)), 4),
+                'complete_rate': round(sum(all(s.values()) for s in found) / len(found), 4),
+                'label_accuracy': _label_accuracy(zip((c[0] for c in documents), found), labels)
+            })
+
+            if id_pairs:
+                parsed = [read_id_card(paths) for paths in id_pairs]
+                required = 10  # fields checked by IDCardProcessor._get_missing_fields
+                yield (f"id_card@{name}", 'profiles', id_pairs, read_id_card, None, {
+                    'success_rate': round(sum(p['success'] for p in parsed) / len(parsed), 4),
+                    'fields_found_rate': round(sum(required - len(p.get('missing_fields', []))
+                                                   for p in parsed) / (required * len(parsed)), 4),
+                    'label_accuracy': _label_accuracy(
+                        zip((os.path.basename(paths[0]) for paths in id_pairs), (p['data'] for p in parsed)),
+                        labels)
+                })
+        finally:
+            pool.shutdown()
+
+
+def e2e_benchmarks(fixtures, args):
+    """Yield (name, group, cases, fn, before_each) for requests through the Flask test client"""
+    import main as service
+
+    client = service.app.test_client()
+    images = fixtures['images'] + [synthetic_carte_grise()]
+    documents = images + fixtures['pdfs']
+    pairs = list(zip(images, images[1:] + images[:1]))
+    face_pairs = list(zip(fixtures['faces'], fixtures['faces'][1:] + fixtures['faces'][:1]))
+
+    def clear_caches():
+        service.face_encoding_cache.clear()
+        service.ocr_result_cache.clear()
+
+    before_each = None if args.warm_cache else clear_caches
+
+    def post(path, files):
+        data = {field: (io.BytesIO(content), name) for field, (name, content) in files.items()}
+        response = client.post(path, data=data, content_type='multipart/form-data')
+        # 4xx answers (no face found, unreadable card) are valid outcomes here
+        if response.status_code >= 500:
+            raise RuntimeError(f"{path} answered {response.status_code}")
+
+    yield ('e2e_compare_faces', 'e2e', face_pairs,
+           lambda pair: post('/api/compare-faces', {'image1': pair[0], 'image2': pair[1]}), before_each)
+    if args.skip_ocr:
+        return
+
+    yield ('e2e_extract_text', 'e2e', documents,
+           lambda case: post('/api/extract-text', {'image': case}), before_each)
+    yield ('e2e_process_id_card', 'e2e', pairs,
+           lambda pair: post('/api/process-id-card', {'front_image': pair[0], 'back_image': pair[1]}), before_each)
+
+    service.ocr.shutdown()
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Return [(name, metric, old, new, ratio)] for latencies slower than baseline by more than tolerance"""
+    regressions = []
+    for name, current in results['benchmarks'].items():
+        previous = baseline.get('benchmarks', {}).get(name)
+        if not previous:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            ratio = new / old
+            current.setdefault('vs_baseline', {})[metric] = round(ratio, 3)
+            if ratio > 1 + tolerance:
+                regressions.append((name, metric, old, new, ratio))
+    return regressions
+
+
+def print_table(results):
+    header = (f"{'benchmark':<22}{'calls':>7}{'err':>5}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+              f"{'rss MB':>9}{'py MB':>9}")
+    print(header)
+    print('-' * len(header))
+    for name, stats in results['benchmarks'].items():
+        cells = [stats['throughput_per_s'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms']]
+        cells = [f"{value:>10.2f}" if value is not None else f"{'-':>10}" for value in cells]
+        memory = [stats['peak_rss_bytes'], stats['peak_traced_python_bytes']]
+        memory = [f"{value / (1024 * 1024):>9.1f}" if value is not None else f"{'-':>9}" for value in memory]
+        print(f"{name:<22}{stats['calls']:>7}{stats['errors']:>5}{''.join(cells)}{''.join(memory)}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the vision service components and endpoints')
+    parser.add_argument('--fixtures', default=DEFAULT_FIXTURES, help='Directory scanned for images and PDFs')
+    parser.add_argument('--face-fixtures', help='Directory of photos with one face each, for the face benchmarks')
+    parser.add_argument('--max-fixtures', type=int, default=10, help='Images and PDFs used, each')
+    parser.add_argument('--iterations', type=int, default=3, help='Timed passes over the fixtures')
+    parser.add_argument('--warmup', type=int, default=1, help='Untimed passes before timing')
+    parser.add_argument('--only', help='Comma-separated benchmark names or groups (face, pdf, ocr, parse, e2e)')
+    parser.add_argument('--dpi', type=int, default=72, help='PDF render DPI')
+    parser.add_argument('--ocr-workers', type=int, default=0, help='OCR processes for isolated OCR (0 = in-process)')
+    parser.add_argument('--skip-ocr', action='store_true', help='Skip benchmarks that load the OCR model')
+    parser.add_argument('--profile', default=os.environ.get('OCR_PROFILE', 'legacy'),
+                        help='OCR profile of the isolated OCR benchmarks')
+    parser.add_argument('--profiles', help='Comma-separated OCR profiles to compare for accuracy and latency')
+    parser.add_argument('--labels', help='Expected field values per document, for --profiles')
+    parser.add_argument('--warm-cache', action='store_true', help='Keep the e2e caches warm between calls')
+    parser.add_argument('--output', help='Write results JSON here')
+    parser.add_argument('--baseline', help='Results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed p50/p95 slowdown vs the baseline')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    # Keep e2e runs away from persistent caches and the real enrollment index
+    if not args.warm_cache:
+        os.environ.pop('FACE_CACHE_DIR', None)
+        os.environ.pop('OCR_CACHE_DIR', None)
+    os.environ.setdefault('FACE_INDEX_DIR', tempfile.mkdtemp(prefix='benchmark-face-index-'))
+    os.environ.setdefault('OCR_WORKERS', str(args.ocr_workers))
+
+    fixtures = load_fixtures(args.fixtures, args.max_fixtures)
+    logger.info(f"Loaded {len(fixtures['images'])} images and {len(fixtures['pdfs'])} PDFs from {args.fixtures}")
+    fixtures['faces'] = load_fixtures(args.face_fixtures, args.max_fixtures)['images'] if args.face_fixtures else []
+    if args.face_fixtures:
+        logger.info(f"Loaded {len(fixtures['faces'])} face photos from {args.face_fixtures}")
+    else:
+        logger.info("No --face-fixtures given, skipping the face benchmarks")
+    selected = set(args.only.split(',')) if args.only else None
+
+    benchmarks = {}
+    failed = {}
+    for group in (isolated_benchmarks, e2e_benchmarks, profile_benchmarks):
+        for name, kind, cases, fn, before_each, *accuracy in group(fixtures, args):
+            if selected and name not in selected and kind not in selected:
+                continue
+            if not cases:
+                logger.info(f"Skipping {name}: no fixtures")
+                continue
+            logger.info(f"Running {name} over {len(cases)} cases")
+            try:
+                benchmarks[name] = run_benchmark(cases, fn, args.iterations, args.warmup, before_each)
+            except RuntimeError as e:
+                logger.error(f"Benchmark {name} failed: {str(e)}")
+                failed[name] = str(e)
+                continue
+            if accuracy:
+                benchmarks[name].update(accuracy[0])
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'revision': git_revision(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': vars(args),
+            # ru_maxrss is in KiB on Linux
+            'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        },
+        'benchmarks': benchmarks,
+        'failed': failed
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+
+    print_table(results)
+    for name, stats in benchmarks.items():
+        if 'fields_found_rate' in stats:
+            print(f"{name}: fields found {stats['fields_found_rate']:.1%}, "
+                  f"label accuracy {stats['label_accuracy'] if stats['label_accuracy'] is not None else '-'}")
+    for name, metric, old, new, ratio in regressions:
+        print(f"REGRESSION {name} {metric}: {old:.2f} ms -> {new:.2f} ms ({ratio:.2f}x)")
+    for name, error in failed.items():
+        print(f"FAILED {name}: {error}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        logger.info(f"Results written to {args.output}")
+
+    return 1 if regressions or failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(data):
+    """Return a hex digest identifying the given bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """Hash a file's contents without loading it into memory at once"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ContentCache:
+    """
+    Thread-safe LRU cache keyed by content hash.
+    Entries live in memory up to max_entries; when disk_dir is set they are
+    also pickled there so they survive restarts and can be shared between
+    processes. Entries older than ttl seconds are treated as misses, and
+    expired or unreadable files are deleted when read. The disk tier keeps at
+    most disk_max_entries files (None = unbounded): once a write goes past
+    it, the least recently used files (by mtime, refreshed on disk hits) are
+    pruned down to 90% of the limit.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None, disk_dir=None, disk_max_entries=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_count = 0
+        self._stats = {
+            'hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'disk_evictions': 0,
+            'expired': 0
+        }
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_count = len(self._disk_files())
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self._is_fresh(stored_at, now):
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return value
+                del self._entries[key]
+                self._stats['expired'] += 1
+
+        entry = self._read_disk(key)
+        if entry is not None and not self._is_fresh(entry[0], now):
+            self._remove_disk(self._disk_path(key))
+            with self._lock:
+                self._stats['expired'] += 1
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            # Promote to the memory tier so the next lookup skips the disk
+            self._stats['disk_hits'] += 1
+            self._store(key, entry)
+            return entry[1]
+
+    def put(self, key, value):
+        """Store value under key in every configured tier"""
+        entry = (time.time(), value)
+        with self._lock:
+            self._store(key, entry)
+        self._write_disk(key, entry)
+
+    def clear(self):
+        """Drop every in-memory entry (the disk tier is left untouched)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current occupancy"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['max_entries'] = self.max_entries
+        stats['hit_rate'] = round((stats['hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        stats['disk_enabled'] = bool(self.disk_dir)
+        if self.disk_dir:
+            with self._disk_lock:
+                stats['disk_size'] = self._disk_count
+            stats['disk_max_entries'] = self.disk_max_entries
+        return stats
+
+    def _is_fresh(self, stored_at, now):
+        return self.ttl is None or now - stored_at <= self.ttl
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _disk_path(self, key):
+        # Keys may carry parameters, so hash them into a safe file name
+        name = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.disk_dir, name[:2], f"{name}.pkl")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Error reading cache entry {path}: {str(e)}")
+            self._remove_disk(path)
+            return None
+
+        # Refresh the mtime so pruning drops the least recently used files
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def _write_disk(self, key, entry):
+        if not self.disk_dir:
+            return
+
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            created = not os.path.exists(path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Error writing cache entry {path}: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        if created:
+            with self._disk_lock:
+                self._disk_count += 1
+                over_limit = self.disk_max_entries is not None and self._disk_count > self.disk_max_entries
+            if over_limit:
+                self._prune_disk()
+
+    def _disk_files(self):
+        """Return (mtime, path) for every entry file in the disk tier"""
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if not name.endswith('.pkl'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    # Removed by another process in the meantime
+                    continue
+        return files
+
+    def _remove_disk(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+        with self._disk_lock:
+            self._disk_count = max(0, self._disk_count - 1)
+        return True
+
+    def _prune_disk(self):
+        """Delete the oldest disk entries down to 90% of disk_max_entries"""
+        with self._disk_lock:
+            # Other processes sharing the directory also add and prune files,
+            # so the directory listing is the source of truth here
+            files = sorted(self._disk_files())
+            target = int(self.disk_max_entries * 0.9)
+            removed = 0
+            for _, path in files[:max(0, len(files) - target)]:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    continue
+            self._disk_count = len(files) - removed
+
+        with self._lock:
+            self._stats['disk_evictions'] += removed
@@ -0,0 +1,54 @@
+import threading
+
+
+class QueueFullError(Exception):
+    """Raised when a bounded executor has no room for another task"""
+
+    status_code = 429
+
+    def __init__(self, retry_after=1):
+        super().__init__('Too many pending requests')
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    Wrap an executor so that at most max_pending tasks are queued or running.
+    Submissions beyond that fail fast with QueueFullError instead of piling up.
+    """
+
+    def __init__(self, executor, max_pending, retry_after=1):
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self._executor = executor
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        """Number of tasks currently queued or running"""
+        return self._pending
+
+    def submit(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError(self.retry_after)
+
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._pending += 1
+        future.add_done_callback(self._release)
+        return future
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
@@ -1,49 +1,141 @@
 import cv2
 import numpy as np
-import face_recognition
 import base64
+import threading
+import time
+from content_cache import file_hash
+from metrics import metrics
+
+_face_recognition = None
+_models_lock = threading.Lock()
+
+def load_face_models():
+    """Import face_recognition, which loads the dlib models, on first use only"""
+    global _face_recognition
+    if _face_recognition is None:
+        with _models_lock:
+            if _face_recognition is None:
+                import face_recognition
+                _face_recognition = face_recognition
+    return _face_recognition
 
 class FaceComparator:
-    def __init__(self, similarity_threshold=0.4):
+    def __init__(self, similarity_threshold=0.4, encoding_cache=None,
+                 detection_max_side=800, detection_upsample=1, detection_model='hog'):
         self.similarity_threshold = similarity_threshold
+        # Optional ContentCache of (encoding, location) keyed by image content hash
+        self.encoding_cache = encoding_cache
+        # Faces are detected on a copy whose longest side is at most detection_max_side
+        # (None detects at full resolution); model is 'hog' or 'cnn'
+        self.detection_max_side = detection_max_side
+        self.detection_upsample = detection_upsample
+        self.detection_model = detection_model
 
-    def load_image(self, image_path):
-        """Load and convert image to RGB format"""
-        image = cv2.imread(image_path)
-        if image is None:
-            raise ValueError(f"Could not load image from {image_path}")
-        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    def warmup(self):
+        """Load the models and run detection and encoding once on a dummy image"""
+        face_recognition = load_face_models()
+        image = np.full((160, 160, 3), 128, dtype=np.uint8)
+        face_recognition.face_locations(image, model=self.detection_model)
+        face_recognition.face_encodings(image, [(20, 140, 140, 20)])
 
-    def extract_face_encoding(self, image):
-        """Extract face encoding from image"""
-        face_locations = face_recognition.face_locations(image)
-        
+    def load_image(self, image):
+        """Load and convert image to RGB format (accepts a path or an UploadedFile)"""
+        if isinstance(image, str):
+            bgr = cv2.imread(image)
+            if bgr is None:
+                raise ValueError(f"Could not load image from {image}")
+        else:
+            bgr = image.decode_image()
+        return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+    def content_key(self, image):
+        """Content hash used to look up cached encodings"""
+        digest = file_hash(image) if isinstance(image, str) else image.digest
+        # Detection settings change the box and therefore the encoding
+        return f"{digest}:{self.detection_max_side}:{self.detection_upsample}:{self.detection_model}"
+
+    def detect_face(self, image):
+        """
+        Find the first face on a downscaled copy of the image.
+        Returns its (top, right, bottom, left) box in full-resolution coordinates, or None.
+        """
+        height, width = image.shape[:2]
+        scale = 1.0
+        small = image
+
+        if self.detection_max_side and max(height, width) > self.detection_max_side:
+            scale = self.detection_max_side / max(height, width)
+            small = cv2.resize(
+                image,
+                (max(1, round(width * scale)), max(1, round(height * scale))),
+                interpolation=cv2.INTER_AREA
+            )
+
+        face_locations = load_face_models().face_locations(
+            small,
+            number_of_times_to_upsample=self.detection_upsample,
+            model=self.detection_model
+        )
         if not face_locations:
+            return None
+
+        top, right, bottom, left = face_locations[0]
+        return (
+            max(0, int(top / scale)),
+            min(width, int(right / scale)),
+            min(height, int(bottom / scale)),
+            max(0, int(left / scale))
+        )
+
+    def extract_face_encoding(self, image, timings=None):
+        """Extract face encoding from image, recording detection time in timings if given"""
+        start = time.perf_counter()
+        face_location = self.detect_face(image)
+        detection_time = time.perf_counter() - start
+        metrics.record_stage('face_detection', detection_time)
+        if timings is not None:
+            timings['detection_ms'] = round(detection_time * 1000, 2)
+        
+        if face_location is None:
             raise ValueError("No face detected in the image")
         
-        face_encodings = face_recognition.face_encodings(image, [face_locations[0]])
+        with metrics.stage('face_encoding'):
+            face_encodings = load_face_models().face_encodings(image, [face_location])
         
         if not face_encodings:
             raise ValueError("Could not encode the face in the image")
             
-        return face_encodings[0], face_locations[0]
+        return face_encodings[0], face_location
+
+    def get_face_encoding(self, image, timings=None):
+        """Return face encoding and location, reusing a cached result for identical images"""
+        if self.encoding_cache is None:
+            return self.extract_face_encoding(self.load_image(image), timings)
+
+        key = self.content_key(image)
+        cached = self.encoding_cache.get(key)
+        if cached is not None:
+            if timings is not None:
+                timings['cache_hit'] = True
+            return cached
 
-    def compare_faces(self, image1_path, image2_path):
+        result = self.extract_face_encoding(self.load_image(image), timings)
+        self.encoding_cache.put(key, result)
+        return result
+
+    def compare_faces(self, image1, image2):
         """
-        Compare faces in two images and return similarity results.
+        Compare faces in two images (paths or UploadedFile objects) and return similarity results.
         Returns dict with match result, confidence score, and face locations.
         """
         try:
-            # Load images
-            image1 = self.load_image(image1_path)
-            image2 = self.load_image(image2_path)
-
-            # Get face encodings
-            encoding1, location1 = self.extract_face_encoding(image1)
-            encoding2, location2 = self.extract_face_encoding(image2)
+            # Get face encodings (cached images skip loading and detection)
+            timings = {'image1': {}, 'image2': {}}
+            encoding1, location1 = self.get_face_encoding(image1, timings['image1'])
+            encoding2, location2 = self.get_face_encoding(image2, timings['image2'])
 
             # Calculate similarity
-            distance = face_recognition.face_distance([encoding1], encoding2)[0]
+            distance = load_face_models().face_distance([encoding1], encoding2)[0]
             confidence = float(1 - distance)  # Convert to float
             # Explicitly convert numpy.bool_ to Python bool
             is_match = True if confidence >= self.similarity_threshold else False
@@ -59,7 +151,8 @@ class FaceComparator:
                 'face_locations': {
                     'image1': loc1,
                     'image2': loc2
-                }
+                },
+                'timings': timings
             }
 
             return result
@@ -68,4 +161,86 @@ class FaceComparator:
             return {
                 'success': False,
                 'error': str(e)
-            }
\ No newline at end of file
+            }
+
+    def compare_to_template(self, template, image):
+        """
+        Compare the face in one image against a stored 128-d encoding.
+        Only the image is encoded; returns the same shape as compare_faces.
+        """
+        try:
+            timings = {'image': {}}
+            # Live frames are one-off captures, so they bypass the encoding cache
+            encoding, location = self.extract_face_encoding(self.load_image(image), timings['image'])
+
+            distance = load_face_models().face_distance([template], encoding)[0]
+            confidence = float(1 - distance)
+
+            return {
+                'success': True,
+                'match': True if confidence >= self.similarity_threshold else False,
+                'confidence': float(round(confidence * 100, 2)),
+                'face_location': [int(i) for i in location],
+                'timings': timings
+            }
+
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    def compare_burst(self, reference, frames):
+        """
+        Compare one reference image against a burst of frames (e.g. webcam captures).
+        The reference is encoded once; frames are encoded in order and the scan
+        stops at the first frame whose confidence reaches the threshold.
+        Frames without a detectable face are skipped. Returns the best frame's score.
+        """
+        try:
+            reference_encoding, reference_location = self.get_face_encoding(reference)
+
+            best = None
+            frames_without_face = []
+            frames_scored = 0
+
+            for index, frame in enumerate(frames):
+                # Burst frames are one-off captures, so they bypass the encoding cache
+                try:
+                    encoding, location = self.extract_face_encoding(self.load_image(frame))
+                except ValueError:
+                    frames_without_face.append(index)
+                    continue
+
+                frames_scored += 1
+                distance = load_face_models().face_distance([reference_encoding], encoding)[0]
+                confidence = float(1 - distance)
+
+                if best is None or confidence > best['confidence']:
+                    best = {'index': index, 'confidence': confidence, 'location': location}
+
+                if confidence >= self.similarity_threshold:
+                    break
+
+            if best is None:
+                raise ValueError("No face detected in any frame")
+
+            return {
+                'success': True,
+                'match': True if best['confidence'] >= self.similarity_threshold else False,
+                'confidence': float(round(best['confidence'] * 100, 2)),
+                'best_frame': best['index'],
+                'frames_scored': frames_scored,
+                'frames_total': len(frames),
+                'frames_without_face': frames_without_face,
+                'face_locations': {
+                    'reference': [int(i) for i in reference_location],
+                    'frame': [int(i) for i in best['location']]
+                }
+            }
+
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
@@ -0,0 +1,206 @@
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+
+class AlreadyEnrolledError(Exception):
+    """Raised when enrolling a user_id that already has a template without replace=True"""
+
+    status_code = 409
+
+    def __init__(self, user_id):
+        super().__init__(f"A face is already enrolled for user {user_id!r}")
+        self.user_id = user_id
+
+
+class FaceIndex:
+    """
+    Enrollment store of 128-d face encodings for 1:N search.
+    Encodings are rows of a float32 matrix memory-mapped from
+    <directory>/encodings.f32; the matching ids are appended, one per line,
+    to <directory>/ids.txt. An id is enrolled once; replacing its template
+    takes an explicit replace=True, which overwrites its row in place.
+
+    Several processes (e.g. gunicorn workers) may share one directory:
+    writers serialize on an flock of <directory>/.lock, and every operation
+    first picks up ids appended by other processes since its last look.
+    """
+
+    DIMENSIONS = 128
+
+    def __init__(self, directory, chunk_size=65536, initial_capacity=1024):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.initial_capacity = initial_capacity
+        self._matrix_path = os.path.join(directory, 'encodings.f32')
+        self._ids_path = os.path.join(directory, 'ids.txt')
+        self._lock_path = os.path.join(directory, '.lock')
+        self._lock = threading.Lock()
+        self._ids = []
+        self._rows = {}
+        # Bytes of ids.txt already read into _ids
+        self._ids_offset = 0
+
+        os.makedirs(directory, exist_ok=True)
+        with self._lock, self._file_lock():
+            self._read_new_ids()
+            self._matrix = self._open_matrix()
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._ids)
+
+    def __contains__(self, user_id):
+        with self._lock:
+            self._refresh()
+            return user_id in self._rows
+
+    def enroll(self, user_id, encoding, replace=False):
+        """
+        Store the encoding for user_id.
+        Raises AlreadyEnrolledError when user_id is already enrolled, unless
+        replace is True.
+        """
+        if not user_id or '\n' in user_id:
+            raise ValueError("user_id must be a non-empty single-line string")
+
+        vector = np.asarray(encoding, dtype=np.float32).reshape(self.DIMENSIONS)
+
+        with self._lock, self._file_lock():
+            # Another process may have enrolled since; its rows must not be reused
+            self._refresh()
+            row = self._rows.get(user_id)
+            if row is not None:
+                if not replace:
+                    raise AlreadyEnrolledError(user_id)
+                self._matrix[row] = vector
+                self._matrix.flush()
+                return
+
+            row = len(self._ids)
+            if row >= self._matrix.shape[0]:
+                self._grow(max(self.initial_capacity, self._matrix.shape[0] * 2))
+
+            # Write the row before its id so a crash never exposes an empty row
+            self._matrix[row] = vector
+            self._matrix.flush()
+            line = f"{user_id}\n".encode('utf-8')
+            with open(self._ids_path, 'ab') as f:
+                f.write(line)
+
+            self._ids.append(user_id)
+            self._rows[user_id] = row
+            self._ids_offset += len(line)
+
+    def get(self, user_id):
+        """Return the stored encoding for user_id, or None"""
+        with self._lock:
+            self._refresh()
+            row = self._rows.get(user_id)
+            if row is None:
+                return None
+            return np.array(self._matrix[row], dtype=np.float64)
+
+    def search(self, encoding, k=5):
+        """
+        Return the k enrolled ids closest to encoding as (user_id, distance)
+        pairs, nearest first. Distances are the Euclidean distances used by
+        face_recognition.face_distance, computed chunk by chunk so only
+        chunk_size rows are resident at a time.
+        """
+        with self._lock:
+            self._refresh()
+            count = len(self._ids)
+            matrix = self._matrix
+            ids = self._ids[:count]
+
+        if count == 0 or k <= 0:
+            return []
+
+        query = np.asarray(encoding, dtype=np.float32).reshape(self.DIMENSIONS)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_distances = np.empty(0, dtype=np.float32)
+
+        for start in range(0, count, self.chunk_size):
+            chunk = matrix[start:min(start + self.chunk_size, count)]
+            distances = np.linalg.norm(chunk - query, axis=1)
+
+            # Keep only this chunk's k best before merging with the running best
+            if len(distances) > k:
+                top = np.argpartition(distances, k)[:k]
+            else:
+                top = np.arange(len(distances))
+
+            best_rows = np.concatenate([best_rows, top + start])
+            best_distances = np.concatenate([best_distances, distances[top]])
+            if len(best_distances) > k:
+                keep = np.argpartition(best_distances, k)[:k]
+                best_rows = best_rows[keep]
+                best_distances = best_distances[keep]
+
+        order = np.argsort(best_distances)
+        return [(ids[best_rows[i]], float(best_distances[i])) for i in order]
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock shared by every process using this directory"""
+        with open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_new_ids(self):
+        """Append ids written to ids.txt (by any process) since the last read"""
+        try:
+            size = os.path.getsize(self._ids_path)
+        except FileNotFoundError:
+            return
+        if size <= self._ids_offset:
+            return
+
+        with open(self._ids_path, 'rb') as f:
+            f.seek(self._ids_offset)
+            chunk = f.read(size - self._ids_offset)
+
+        # Leave a line still being written for the next refresh
+        end = chunk.rfind(b'\n') + 1
+        for user_id in chunk[:end].decode('utf-8').split('\n'):
+            if user_id.strip():
+                self._rows[user_id] = len(self._ids)
+                self._ids.append(user_id)
+        self._ids_offset += end
+
+    def _refresh(self):
+        """Catch up with enrollments and matrix growth from other processes"""
+        self._read_new_ids()
+        capacity = os.path.getsize(self._matrix_path) // (self.DIMENSIONS * 4)
+        if capacity != self._matrix.shape[0]:
+            self._matrix = np.memmap(self._matrix_path, dtype=np.float32, mode='r+',
+                                     shape=(capacity, self.DIMENSIONS))
+
+    def _open_matrix(self):
+        capacity = 0
+        if os.path.exists(self._matrix_path):
+            capacity = os.path.getsize(self._matrix_path) // (self.DIMENSIONS * 4)
+
+        if capacity < max(len(self._ids), 1):
+            capacity = max(self.initial_capacity, len(self._ids))
+            self._resize_file(capacity)
+
+        return np.memmap(self._matrix_path, dtype=np.float32, mode='r+',
+                         shape=(capacity, self.DIMENSIONS))
+
+    def _resize_file(self, capacity):
+        with open(self._matrix_path, 'ab') as f:
+            f.truncate(capacity * self.DIMENSIONS * 4)
+
+    def _grow(self, capacity):
+        self._matrix.flush()
+        self._resize_file(capacity)
+        self._matrix = np.memmap(self._matrix_path, dtype=np.float32, mode='r+',
+                                 shape=(capacity, self.DIMENSIONS))
@@ -0,0 +1,35 @@
+import os
+
+# gunicorn -c gunicorn.conf.py wsgi:app
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8080')
+
+# Each worker process owns its own OCR pool of OCR_WORKERS processes, so the
+# OCR process count is workers * OCR_WORKERS
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+
+# Request threads mostly wait on the face/OCR executors, so a handful per
+# worker keeps /health, /ready and /metrics responsive during long requests
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Load the app (and the face models) once in the master before forking
+preload_app = True
+
+# Multi-page PDF OCR can legitimately take a while
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    """Start the OCR workers and warm the models in each forked worker"""
+    from main import warmup
+    warmup.start()
+
+
+def worker_exit(server, worker):
+    from main import face_executor, ocr
+    face_executor.shutdown(wait=False)
+    ocr.shutdown(wait=False)
@@ -0,0 +1,140 @@
+import re
+import cv2
+import numpy as np
+from ocr_pool import worker_ocr
+
+# Canonical size of a normalized card (ID-1 format, 85.60 x 53.98 mm)
+CARD_WIDTH = 1000
+CARD_HEIGHT = 630
+
+# Field regions of the Moroccan CNIE as (x0, y0, x1, y1) fractions of the
+# normalized card. Back-side regions keep their printed labels ("Fils de",
+# "Adresse", ...) because IDCardProcessor keys on them.
+CNIE_REGIONS = {
+    'front': [
+        ('first_name', (0.30, 0.24, 0.78, 0.33)),
+        ('last_name', (0.30, 0.33, 0.78, 0.42)),
+        ('date_of_birth', (0.30, 0.44, 0.78, 0.53)),
+        ('place_of_birth', (0.30, 0.53, 0.78, 0.62)),
+        ('expiry_date', (0.30, 0.66, 0.78, 0.75)),
+        ('card_number', (0.02, 0.80, 0.40, 0.93))
+    ],
+    'back': [
+        ('father_name', (0.02, 0.18, 0.98, 0.28)),
+        ('mother_name', (0.02, 0.28, 0.98, 0.38)),
+        ('civil_status_number', (0.02, 0.40, 0.50, 0.50)),
+        ('address', (0.02, 0.50, 0.98, 0.62)),
+        ('gender', (0.55, 0.40, 0.98, 0.50))
+    ]
+}
+
+# Fields whose value is a single token: keep only the matching part of the crop text
+FIELD_PATTERNS = {
+    'date_of_birth': re.compile(r'\d{2}\.\d{2}\.\d{4}'),
+    'expiry_date': re.compile(r'\d{2}\.\d{2}\.\d{4}'),
+    'card_number': re.compile(r'[A-Z]{1,2}\d{6}'),
+    'civil_status_number': re.compile(r'\d{3}/\d{4}')
+}
+
+# Longest side used when searching for the card outline
+_DETECTION_MAX_SIDE = 1000
+
+
+def _order_corners(points):
+    """Order four points as top-left, top-right, bottom-right, bottom-left"""
+    points = points.reshape(4, 2).astype(np.float32)
+    sums = points.sum(axis=1)
+    diffs = np.diff(points, axis=1).ravel()
+    return np.array([
+        points[np.argmin(sums)],
+        points[np.argmin(diffs)],
+        points[np.argmax(sums)],
+        points[np.argmax(diffs)]
+    ], dtype=np.float32)
+
+
+def find_card_quad(image, min_area_ratio=0.2):
+    """
+    Locate the card outline in a BGR image.
+    Returns its four corners in image coordinates, or None when no
+    sufficiently large quadrilateral is found.
+    """
+    height, width = image.shape[:2]
+    scale = min(1.0, _DETECTION_MAX_SIDE / max(height, width))
+    small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else image
+
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    edges = cv2.dilate(cv2.Canny(gray, 50, 150), None, iterations=2)
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    min_area = min_area_ratio * small.shape[0] * small.shape[1]
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True):
+        if cv2.contourArea(contour) < min_area:
+            break
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        if len(approx) == 4:
+            return _order_corners(approx) / scale
+    return None
+
+
+def normalize_card(image, quad):
+    """Deskew the card to the canonical landscape size"""
+    top_left, top_right, bottom_right, bottom_left = quad
+    card_width = max(np.linalg.norm(top_right - top_left), np.linalg.norm(bottom_right - bottom_left))
+    card_height = max(np.linalg.norm(bottom_left - top_left), np.linalg.norm(bottom_right - top_right))
+
+    # A card photographed in portrait orientation is rotated to landscape
+    if card_height > card_width:
+        quad = np.array([top_right, bottom_right, bottom_left, top_left], dtype=np.float32)
+
+    target = np.array([
+        [0, 0],
+        [CARD_WIDTH - 1, 0],
+        [CARD_WIDTH - 1, CARD_HEIGHT - 1],
+        [0, CARD_HEIGHT - 1]
+    ], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(quad.astype(np.float32), target)
+    return cv2.warpPerspective(image, matrix, (CARD_WIDTH, CARD_HEIGHT))
+
+
+def crop_regions(card, side):
+    """Return [(field, crop)] for the known field regions of one card side"""
+    crops = []
+    for field, (x0, y0, x1, y1) in CNIE_REGIONS[side]:
+        crop = card[int(y0 * CARD_HEIGHT):int(y1 * CARD_HEIGHT), int(x0 * CARD_WIDTH):int(x1 * CARD_WIDTH)]
+        crops.append((field, np.ascontiguousarray(crop)))
+    return crops
+
+
+def recognize_crops(crops):
+    """Run recognition only (no detection, no angle classifier) on each crop inside an OCR worker"""
+    results = []
+    for crop in crops:
+        result = worker_ocr(crop, det=False, cls=False)
+        text, confidence = result[0][0] if result and result[0] else ('', 0.0)
+        results.append((text, float(confidence)))
+    return results
+
+
+def template_lines(fields, recognized, min_confidence):
+    """
+    Turn per-region recognition results into OCR-style lines for IDCardProcessor.
+    Returns None when any region is empty or below min_confidence, meaning the
+    template did not fit and full detection should be used instead.
+    """
+    lines = []
+    for field, (text, confidence) in zip(fields, recognized):
+        text = text.strip()
+        if not text or confidence < min_confidence:
+            return None
+
+        pattern = FIELD_PATTERNS.get(field)
+        if pattern:
+            match = pattern.search(text.replace(' ', ''))
+            if not match:
+                return None
+            text = match.group(0)
+
+        lines.append({"order": len(lines) + 1, "text": text})
+    return lines
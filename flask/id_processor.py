@@ -1,18 +1,40 @@
 import re
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from typing import List, Dict, Union, Optional
 
+HEADER_KEYWORDS = [
+    'ROYAUME',
+    'MAROC',
+    'CARTE',
+    'NATIONALE',
+    'IDENTITE',
+    "D'IDENTITE",
+    'ELECTRONIQUE'
+]
+
+# Patterns are compiled once at import; each OCR line is classified in a single pass
+CIVIL_STATUS_PATTERN = re.compile(r'\d{3}/\d{4}')
+FRONT_LINE_PATTERN = re.compile(r'(?P<date>\d{2}\.\d{2}\.\d{4})|(?P<id_number>[A-Z]{1,2}\d{6})')
+HEADER_PATTERN = re.compile('|'.join(re.escape(keyword) for keyword in HEADER_KEYWORDS))
+PLACE_OF_BIRTH_PREFIXES = ('a ', 'à ')
+
+# Back side labels: (keyword, field, how the value is read from the line)
+BACK_FIELDS = [
+    ('Fils de', 'father_name', 'after'),
+    ('et de', 'mother_name', 'after'),
+    ('Adresse', 'address', 'after'),
+    ('Sexe', 'gender', 'remove')
+]
+
+
+def _line_text(item):
+    return item['text'].strip() if isinstance(item, dict) else item.strip()
+
+
 class IDCardProcessor:
     def __init__(self):
-        self.HEADER_KEYWORDS = [
-            'ROYAUME',
-            'MAROC',
-            'CARTE',
-            'NATIONALE',
-            'IDENTITE',
-            "D'IDENTITE",
-            'ELECTRONIQUE'
-        ]
+        self.HEADER_KEYWORDS = HEADER_KEYWORDS
 
     def process_id_card(self, front_text_array, back_text_array):
         data = {
@@ -36,50 +58,54 @@ class IDCardProcessor:
 
         return self._format_response(data)
 
+    def process_many(self, pairs, workers=None, chunksize=256):
+        """
+        Process many (front_text_array, back_text_array) pairs, e.g. stored OCR outputs.
+        With workers > 1 the pairs are spread over a process pool in chunks.
+        """
+        if not workers or workers <= 1:
+            return [self.process_id_card(front, back) for front, back in pairs]
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(_process_pair, pairs, chunksize=chunksize))
+
     def _process_back_text(self, back_text_array, data):
         for item in back_text_array:
-            text = item['text'].strip() if isinstance(item, dict) else item.strip()
+            text = _line_text(item)
 
-            if 'Fils de' in text:
-                data['father_name'] = text.split('Fils de')[-1].strip()
-            
-            if 'et de' in text:
-                data['mother_name'] = text.split('et de')[-1].strip()
-            
-            if 'Adresse' in text:
-                data['address'] = text.split('Adresse')[-1].strip()
-            
-            if self._is_civil_status_number(text):
+            for keyword, field, mode in BACK_FIELDS:
+                if keyword in text:
+                    if mode == 'after':
+                        data[field] = text.split(keyword)[-1].strip()
+                    else:
+                        data[field] = text.replace(keyword, '').strip()
+
+            if CIVIL_STATUS_PATTERN.fullmatch(text):
                 data['civil_status_number'] = text
-            
-            if 'Sexe' in text:
-                data['gender'] = text.replace('Sexe', '').strip()
 
     def _process_front_text(self, front_text_array, data):
         valid_names = []
         dates = []
 
         for item in front_text_array:
-            text = item['text'].strip() if isinstance(item, dict) else item.strip()
-            
+            text = _line_text(item)
+
             if self._is_valid_name(text):
                 valid_names.append(text)
 
-        if len(valid_names) >= 2:
-            data['first_name'], data['last_name'] = valid_names[:2]
-
-        for item in front_text_array:
-            text = item['text'].strip() if isinstance(item, dict) else item.strip()
+            match = FRONT_LINE_PATTERN.fullmatch(text)
+            if match:
+                if match.lastgroup == 'date':
+                    dates.append(text)
+                else:
+                    data['card_number'] = text
+                continue
 
-            if self._is_date_format(text):
-                dates.append(text)
-            
-            if self._is_id_number(text):
-                data['card_number'] = text
-            
-            if text.lower().startswith(('a ', 'à ')):
+            if text.lower().startswith(PLACE_OF_BIRTH_PREFIXES):
                 data['place_of_birth'] = text[2:].upper()
 
+        if len(valid_names) >= 2:
+            data['first_name'], data['last_name'] = valid_names[:2]
 
         if len(dates) >= 2:
             sorted_dates = sorted(dates, key=lambda x: self._get_year(x))
@@ -115,10 +141,6 @@ class IDCardProcessor:
         return response
 
 
-    def _is_date_format(self, text):
-        import re
-        return bool(re.match(r'^\d{2}\.\d{2}\.\d{4}$', text))
-
     def _format_date(self, date_str):
         day, month, year = date_str.split('.')
         return f"{day.zfill(2)}.{month.zfill(2)}.{year}"
@@ -126,16 +148,8 @@ class IDCardProcessor:
     def _get_year(self, date_str):
         return int(date_str.split('.')[-1])
 
-    def _is_id_number(self, text):
-        import re
-        return bool(re.match(r'^[A-Z]{1,2}\d{6}$', text))
-
-    def _is_civil_status_number(self, text):
-        import re
-        return bool(re.match(r'^\d{3}/\d{4}$', text))
-
     def _is_header(self, text):
-        return any(keyword in text for keyword in self.HEADER_KEYWORDS)
+        return HEADER_PATTERN.search(text) is not None
 
     def _is_valid_name(self, text):
         clean_text = text.replace(' ', '')
@@ -169,3 +183,11 @@ class IDCardProcessor:
             missing_fields.append('gender')
             
         return missing_fields
+
+
+_pair_processor = IDCardProcessor()
+
+
+def _process_pair(pair):
+    front_text_array, back_text_array = pair
+    return _pair_processor.process_id_card(front_text_array, back_text_array)
@@ -0,0 +1,162 @@
+import ipaddress
+import json
+import logging
+import threading
+import time
+import urllib.request
+import uuid
+from collections import OrderedDict
+from urllib.parse import urlparse
+from executors import QueueFullError
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+def is_local_url(url):
+    """Accept only http(s) URLs pointing at the loopback interface"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return False
+    if parsed.hostname == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(parsed.hostname).is_loopback
+    except ValueError:
+        return False
+
+
+class Job:
+    """State of one asynchronous job; mutated only by its runner thread"""
+
+    def __init__(self, kind, webhook=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.webhook = webhook
+        self.status = QUEUED
+        self.partial = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in (SUCCEEDED, FAILED)
+
+    def add_partial(self, item):
+        """Publish an intermediate result (e.g. one PDF page) to pollers"""
+        self.partial.append(item)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'partial': list(self.partial),
+            'result': self.result,
+            'error': self.error
+        }
+
+
+class JobStore:
+    """
+    Bounded in-memory store of asynchronous jobs.
+    Finished jobs expire ttl seconds after they finish and are evicted oldest
+    first when the store is full; when every slot holds an unfinished job,
+    submit raises QueueFullError. Work runs on the given (bounded) executor.
+    """
+
+    def __init__(self, executor, max_jobs=256, ttl=600, webhook_timeout=5):
+        self.executor = executor
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.webhook_timeout = webhook_timeout
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def get(self, job_id):
+        """Return the job, or None when it is unknown or expired"""
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def submit(self, kind, fn, *args, webhook=None, on_done=None):
+        """
+        Queue fn(job, *args) and return the job immediately. fn's return value
+        becomes the job result; on_done() runs after it in every case (used to
+        release uploads that outlive the request).
+        """
+        job = Job(kind, webhook)
+        with self._lock:
+            self._expire()
+            if len(self._jobs) >= self.max_jobs and not self._evict_finished():
+                raise QueueFullError(self.executor.retry_after)
+            self._jobs[job.id] = job
+
+        try:
+            self.executor.submit(self._run, job, fn, args, on_done)
+        except Exception:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise
+        return job
+
+    def _run(self, job, fn, args, on_done):
+        job.started_at = time.time()
+        job.status = RUNNING
+        try:
+            job.result = fn(job, *args)
+            job.status = SUCCEEDED
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.kind}) failed: {str(e)}", exc_info=True)
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            if on_done:
+                on_done()
+
+        if job.webhook:
+            self._notify(job)
+
+    def _notify(self, job):
+        body = json.dumps(job.to_dict()).encode('utf-8')
+        webhook_request = urllib.request.Request(
+            job.webhook,
+            data=body,
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        try:
+            with urllib.request.urlopen(webhook_request, timeout=self.webhook_timeout):
+                pass
+        except Exception as e:
+            logger.error(f"Webhook for job {job.id} failed: {str(e)}")
+
+    def _expire(self):
+        if not self.ttl:
+            return
+        deadline = time.time() - self.ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.finished_at < deadline]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _evict_finished(self):
+        for job_id, job in self._jobs.items():
+            if job.finished:
+                del self._jobs[job_id]
+                return True
+        return False
@@ -0,0 +1,161 @@
+from bisect import bisect_left
+from collections import namedtuple
+
+# A recognized piece of text and its axis-aligned box in page/image pixels
+TextBox = namedtuple('TextBox', ['text', 'x0', 'y0', 'x1', 'y1'])
+
+
+def box_from_points(text, points):
+    """Build a TextBox from a PaddleOCR quadrilateral [[x, y], ...]"""
+    xs = [float(point[0]) for point in points]
+    ys = [float(point[1]) for point in points]
+    return TextBox(text, min(xs), min(ys), max(xs), max(ys))
+
+
+def boxes_from_paddle(lines):
+    """Convert PaddleOCR lines [[points, (text, confidence)], ...] into TextBoxes"""
+    return [box_from_points(line[1][0], line[0]) for line in lines]
+
+
+def _center_y(box):
+    return (box.y0 + box.y1) / 2
+
+
+def group_rows(boxes, tolerance=0.5):
+    """
+    Group boxes into rows, top to bottom, each sorted left to right.
+    Boxes are swept by vertical center; a box joins the current row when its
+    center lies within tolerance * the row's mean box height of the row center.
+    """
+    rows = []
+    row = []
+    row_center = row_height = 0.0
+
+    for box in sorted(boxes, key=_center_y):
+        height = max(box.y1 - box.y0, 1.0)
+        if row and abs(_center_y(box) - row_center) <= tolerance * row_height:
+            row.append(box)
+            row_center += (_center_y(box) - row_center) / len(row)
+            row_height += (height - row_height) / len(row)
+        else:
+            if row:
+                rows.append(sorted(row, key=lambda b: b.x0))
+            row = [box]
+            row_center, row_height = _center_y(box), height
+
+    if row:
+        rows.append(sorted(row, key=lambda b: b.x0))
+    return rows
+
+
+def _overlaps_horizontally(a, b):
+    return min(a.x1, b.x1) - max(a.x0, b.x0) > 0
+
+
+def _strip_value(text):
+    return text.strip(' :.-\t')
+
+
+class FieldPairer:
+    """
+    Pair label boxes with their value boxes using layout geometry.
+
+    labels is an ordered list of (field, [lowercase label variants]); the first
+    field whose variant appears in a box claims it. A label's value is, in
+    order of preference: text after the label inside the same box, the nearest
+    box to its right on the same row before the next label (no further than
+    max_right_gap of the page width away, so label and value columns pair up),
+    or the nearest overlapping non-label box in the rows below (up to
+    rows_below[field] rows are joined).
+    """
+
+    def __init__(self, labels, rows_below=None, max_row_gap=2, max_right_gap=0.6):
+        self.labels = labels
+        self.rows_below = rows_below or {}
+        self.max_row_gap = max_row_gap
+        self.max_right_gap = max_right_gap
+
+    def match_label(self, text):
+        """Return (field, variant) for the first label found in text, or None"""
+        lowered = text.lower()
+        for field, variants in self.labels:
+            for variant in variants:
+                if variant in lowered:
+                    return field, variant
+        return None
+
+    def pair(self, boxes):
+        """Return {field: value} for every label found among the boxes"""
+        rows = group_rows(boxes)
+        # Horizontal gaps are measured against the width spanned by all boxes
+        page_width = max(box.x1 for box in boxes) - min(box.x0 for box in boxes) if boxes else 0.0
+        row_starts = [[box.x0 for box in row] for row in rows]
+        label_of = {}
+        for row in rows:
+            for box in row:
+                label = self.match_label(box.text)
+                if label:
+                    label_of[box] = label
+
+        values = {}
+        for row_index, row in enumerate(rows):
+            for position, box in enumerate(row):
+                if box not in label_of:
+                    continue
+                field, variant = label_of[box]
+                if field in values:
+                    continue
+
+                value = self._inline_value(box, variant)
+                if not value:
+                    value = self._right_value(row, position, box, label_of, page_width)
+                if not value:
+                    value = self._below_value(rows, row_starts, row_index, box, label_of,
+                                              self.rows_below.get(field, 1))
+                if value:
+                    values[field] = value
+
+        return values
+
+    def _inline_value(self, box, variant):
+        lowered = box.text.lower()
+        start = lowered.find(variant)
+        return _strip_value(box.text[start + len(variant):])
+
+    def _right_value(self, row, position, box, label_of, page_width):
+        max_x0 = box.x1 + self.max_right_gap * page_width
+        for candidate in row[position + 1:]:
+            if candidate in label_of or candidate.x0 > max_x0:
+                return None
+            value = _strip_value(candidate.text)
+            if value:
+                return value
+        return None
+
+    def _below_value(self, rows, row_starts, row_index, box, label_of, max_rows):
+        parts = []
+        skipped = 0
+
+        for next_index in range(row_index + 1, len(rows)):
+            row = rows[next_index]
+            # Rows are sorted by x0, so only boxes starting before box.x1 can overlap it
+            end = bisect_left(row_starts[next_index], box.x1)
+            below = [candidate for candidate in row[:end] if _overlaps_horizontally(candidate, box)]
+
+            if not below:
+                # Allow a few unrelated rows between a label and its value, but
+                # stop a multi-row value at the first gap
+                skipped += 1
+                if parts or skipped > self.max_row_gap:
+                    break
+                continue
+
+            candidate = below[0]
+            if candidate in label_of:
+                break
+            parts.append(_strip_value(candidate.text))
+            if len(parts) >= max_rows:
+                break
+
+        value = " ".join(part for part in parts if part)
+        return value or None
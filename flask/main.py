@@ -1,15 +1,27 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response
 import os
-from werkzeug.utils import secure_filename
+import hmac
 import logging
+import time
+import contextvars
 from datetime import datetime
-import cv2
-from paddleocr import PaddleOCR
 from face_comparator import FaceComparator
+from content_cache import ContentCache
+from uploaded_file import read_upload
+from ocr_pool import OCRWorkerPool
+from executors import BoundedExecutor, QueueFullError
+from ocr_engine import OCREngine
+from ocr_profiles import load_profile
+from face_index import FaceIndex, AlreadyEnrolledError
+from layout import FieldPairer, boxes_from_paddle
+from metrics import metrics
+from warmup import Warmup
+from jobs import JobStore, is_local_url
+from singleflight import SingleFlight
+from scheduler import AdmissionScheduler, Workload
 from id_processor import IDCardProcessor 
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from flask_cors import CORS
-import fitz
 
 
 # Initialize Flask app
@@ -23,75 +35,296 @@ logger = logging.getLogger(__name__)
 # Configuration
 app.config['UPLOAD_FOLDER'] = 'temp_uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Uploads larger than this are spooled to UPLOAD_FOLDER instead of kept in memory
+app.config['UPLOAD_SPOOL_THRESHOLD'] = int(os.environ.get('UPLOAD_SPOOL_THRESHOLD', 8 * 1024 * 1024))
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf'}
 
+# Face encoding cache (FACE_CACHE_TTL=0 disables expiry, FACE_CACHE_DIR enables the disk tier,
+# FACE_CACHE_DISK_SIZE=0 leaves it unbounded)
+app.config['FACE_CACHE_SIZE'] = int(os.environ.get('FACE_CACHE_SIZE', 512))
+app.config['FACE_CACHE_TTL'] = float(os.environ.get('FACE_CACHE_TTL', 0)) or None
+app.config['FACE_CACHE_DIR'] = os.environ.get('FACE_CACHE_DIR')
+app.config['FACE_CACHE_DISK_SIZE'] = int(os.environ.get('FACE_CACHE_DISK_SIZE', 20000)) or None
+
+# Face detection runs on a copy downscaled to FACE_DETECTION_MAX_SIDE (0 = full resolution)
+app.config['FACE_DETECTION_MAX_SIDE'] = int(os.environ.get('FACE_DETECTION_MAX_SIDE', 800)) or None
+app.config['FACE_DETECTION_UPSAMPLE'] = int(os.environ.get('FACE_DETECTION_UPSAMPLE', 1))
+app.config['FACE_DETECTION_MODEL'] = os.environ.get('FACE_DETECTION_MODEL', 'hog')
+
+# Enrolled face encodings used for 1:N duplicate-identity search
+app.config['FACE_INDEX_DIR'] = os.environ.get('FACE_INDEX_DIR', 'face_index')
+# Enrolled templates are login credentials: an existing one is only replaced
+# with replace=1 and an X-Admin-Token header matching FACE_ADMIN_TOKEN
+# (unset = templates can never be replaced over HTTP)
+app.config['FACE_ADMIN_TOKEN'] = os.environ.get('FACE_ADMIN_TOKEN')
+app.config['FACE_SEARCH_CHUNK'] = int(os.environ.get('FACE_SEARCH_CHUNK', 65536))
+app.config['FACE_SEARCH_MAX_K'] = 50
+
+# Largest number of webcam frames accepted by /api/compare-faces/burst
+app.config['FACE_BURST_MAX_FRAMES'] = int(os.environ.get('FACE_BURST_MAX_FRAMES', 10))
+
+# Face detection/encoding threads; requests beyond FACE_QUEUE_SIZE get a 429
+app.config['FACE_WORKERS'] = int(os.environ.get('FACE_WORKERS', 2))
+app.config['FACE_QUEUE_SIZE'] = int(os.environ.get('FACE_QUEUE_SIZE', 8))
+app.config['FACE_RETRY_AFTER'] = int(os.environ.get('FACE_RETRY_AFTER', 1))
+
+# OCR worker pool (OCR_WORKERS=0 runs a single in-process model)
+app.config['OCR_WORKERS'] = int(os.environ.get('OCR_WORKERS', 2))
+app.config['OCR_QUEUE_SIZE'] = int(os.environ.get('OCR_QUEUE_SIZE', 16))
+app.config['OCR_RETRY_AFTER'] = int(os.environ.get('OCR_RETRY_AFTER', 2))
+# OCR model/inference profile (legacy, mobile, server; see ocr_profiles.py)
+# plus OCR_* overrides such as OCR_CPU_THREADS or OCR_ANGLE_CLS
+app.config['OCR_PROFILE'] = load_profile(os.environ.get('OCR_PROFILE', 'legacy'))
+
+# Admission control: at most ADMISSION_CAPACITY face/OCR requests run at once.
+# Free slots go to interactive face checks first, then ID card OCR, then bulk
+# (PDF) OCR, each capped by its own limit; requests still waiting after their
+# class deadline (seconds) are shed with a 503
+app.config['ADMISSION_CAPACITY'] = int(os.environ.get('ADMISSION_CAPACITY', 8))
+app.config['ADMISSION_QUEUE_SIZE'] = int(os.environ.get('ADMISSION_QUEUE_SIZE', 32))
+app.config['ADMISSION_INTERACTIVE_LIMIT'] = int(os.environ.get('ADMISSION_INTERACTIVE_LIMIT', 8))
+app.config['ADMISSION_INTERACTIVE_DEADLINE'] = float(os.environ.get('ADMISSION_INTERACTIVE_DEADLINE', 2))
+app.config['ADMISSION_ID_OCR_LIMIT'] = int(os.environ.get('ADMISSION_ID_OCR_LIMIT', 6))
+app.config['ADMISSION_ID_OCR_DEADLINE'] = float(os.environ.get('ADMISSION_ID_OCR_DEADLINE', 10))
+app.config['ADMISSION_BULK_OCR_LIMIT'] = int(os.environ.get('ADMISSION_BULK_OCR_LIMIT', 3))
+app.config['ADMISSION_BULK_OCR_DEADLINE'] = float(os.environ.get('ADMISSION_BULK_OCR_DEADLINE', 30))
+
+# Asynchronous jobs: JOB_WORKERS threads drive queued jobs (their OCR/face work
+# still goes through the bounded pools); finished jobs are kept JOB_TTL seconds
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 4))
+app.config['JOB_QUEUE_SIZE'] = int(os.environ.get('JOB_QUEUE_SIZE', 32))
+app.config['JOB_STORE_SIZE'] = int(os.environ.get('JOB_STORE_SIZE', 256))
+app.config['JOB_TTL'] = float(os.environ.get('JOB_TTL', 600)) or None
+
+# PDF rendering: raster DPI for pages without a text layer, and how many pages
+# may be rendered/OCR'd ahead of the one being consumed
+app.config['PDF_RENDER_DPI'] = int(os.environ.get('PDF_RENDER_DPI', 72))
+app.config['PDF_PAGE_WINDOW'] = int(os.environ.get('PDF_PAGE_WINDOW', max(app.config['OCR_WORKERS'], 1)))
+
+# ID_TEMPLATE_OCR=1 reads ID cards from their known field regions first
+# (recognition only), with full-page detection as the fallback when the
+# template does not fit. Off until CNIE_REGIONS is checked on real scans.
+app.config['ID_TEMPLATE_OCR'] = os.environ.get('ID_TEMPLATE_OCR', '0') == '1'
+app.config['ID_TEMPLATE_MIN_CONFIDENCE'] = float(os.environ.get('ID_TEMPLATE_MIN_CONFIDENCE', 0.7))
+
+# OCR result cache (OCR_CACHE_TTL=0 disables expiry, OCR_CACHE_DIR enables the persistent tier,
+# OCR_CACHE_DISK_SIZE=0 leaves it unbounded)
+app.config['OCR_CACHE_SIZE'] = int(os.environ.get('OCR_CACHE_SIZE', 256))
+app.config['OCR_CACHE_TTL'] = float(os.environ.get('OCR_CACHE_TTL', 0)) or None
+app.config['OCR_CACHE_DIR'] = os.environ.get('OCR_CACHE_DIR')
+app.config['OCR_CACHE_DISK_SIZE'] = int(os.environ.get('OCR_CACHE_DISK_SIZE', 10000)) or None
+
 # Create upload folder if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 KEYS = ["Marque", "Genre", "Modele", "Numero d'immatriculation", "Type carburant", "N du chassis"]
+CARTE_GRISE_FIELDS = KEYS + ["Adresse", "Fin de validite"]
+
+# Label variants for each carte grise field (including common OCR misreads);
+# earlier entries win when a line contains several labels
+CARTE_GRISE_LABELS = [
+    ("Marque", ["marque"]),
+    ("Genre", ["genre"]),
+    ("Modele", ["modele"]),
+    ("Numero d'immatriculation", ["numero d'immatriculation", "numero dmatncuaton"]),
+    ("Type carburant", ["type carburant"]),
+    ("N du chassis", ["n du chassis"]),
+    ("Adresse", ["adresse"]),
+    ("Fin de validite", ["fin de validite"])
+]
+# The address may wrap over several lines under its label
+carte_grise_pairer = FieldPairer(CARTE_GRISE_LABELS, rows_below={"Adresse": 3})
+
+# PDF pages with at least this much embedded text skip OCR, unless images
+# cover at least SCANNED_PAGE_IMAGE_COVERAGE of the page and the text is
+# shorter than FULL_TEXT_LAYER_CHARS (a scan with a small text header or stamp)
+MIN_TEXT_LAYER_CHARS = 16
+SCANNED_PAGE_IMAGE_COVERAGE = 0.5
+FULL_TEXT_LAYER_CHARS = 200
 
 # Initialize face comparator and OCR
-face_comparator = FaceComparator(similarity_threshold=0.4)
-ocr = PaddleOCR(use_angle_cls=True, lang='en')
+face_encoding_cache = ContentCache(
+    max_entries=app.config['FACE_CACHE_SIZE'],
+    ttl=app.config['FACE_CACHE_TTL'],
+    disk_dir=app.config['FACE_CACHE_DIR'],
+    disk_max_entries=app.config['FACE_CACHE_DISK_SIZE']
+)
+face_comparator = FaceComparator(
+    similarity_threshold=0.4,
+    encoding_cache=face_encoding_cache,
+    detection_max_side=app.config['FACE_DETECTION_MAX_SIDE'],
+    detection_upsample=app.config['FACE_DETECTION_UPSAMPLE'],
+    detection_model=app.config['FACE_DETECTION_MODEL']
+)
+face_index = FaceIndex(app.config['FACE_INDEX_DIR'], chunk_size=app.config['FACE_SEARCH_CHUNK'])
+ocr = OCRWorkerPool(
+    ocr_kwargs=app.config['OCR_PROFILE'].model_kwargs,
+    call_kwargs=app.config['OCR_PROFILE'].call_kwargs,
+    workers=app.config['OCR_WORKERS'],
+    queue_size=app.config['OCR_QUEUE_SIZE'],
+    retry_after=app.config['OCR_RETRY_AFTER']
+)
+ocr_result_cache = ContentCache(
+    max_entries=app.config['OCR_CACHE_SIZE'],
+    ttl=app.config['OCR_CACHE_TTL'],
+    disk_dir=app.config['OCR_CACHE_DIR'],
+    disk_max_entries=app.config['OCR_CACHE_DISK_SIZE']
+)
+ocr_engine = OCREngine(
+    ocr,
+    cache=ocr_result_cache,
+    dpi=app.config['PDF_RENDER_DPI'],
+    min_text_chars=MIN_TEXT_LAYER_CHARS,
+    max_image_coverage=SCANNED_PAGE_IMAGE_COVERAGE,
+    full_text_chars=FULL_TEXT_LAYER_CHARS,
+    window=app.config['PDF_PAGE_WINDOW'],
+    angle_retry_confidence=app.config['OCR_PROFILE'].angle_retry_confidence
+)
+
+# Model loading and a dummy inference per model; /ready reports 503 until done
+warmup = Warmup([
+    ('face_models', face_comparator.warmup),
+    ('ocr_workers', ocr.start)
+])
+
+# Face work runs here rather than on the request thread, so the number of
+# concurrent dlib calls is bounded and cheap endpoints keep their threads
+face_executor = BoundedExecutor(
+    ThreadPoolExecutor(max_workers=app.config['FACE_WORKERS'], thread_name_prefix='face'),
+    max_pending=app.config['FACE_QUEUE_SIZE'],
+    retry_after=app.config['FACE_RETRY_AFTER']
+)
+
+jobs = JobStore(
+    BoundedExecutor(
+        ThreadPoolExecutor(max_workers=app.config['JOB_WORKERS'], thread_name_prefix='job'),
+        max_pending=app.config['JOB_QUEUE_SIZE'],
+        retry_after=app.config['OCR_RETRY_AFTER']
+    ),
+    max_jobs=app.config['JOB_STORE_SIZE'],
+    ttl=app.config['JOB_TTL']
+)
+
+scheduler = AdmissionScheduler(
+    [
+        Workload('interactive', 0, app.config['ADMISSION_INTERACTIVE_LIMIT'],
+                 app.config['ADMISSION_INTERACTIVE_DEADLINE'], app.config['ADMISSION_QUEUE_SIZE']),
+        Workload('id_ocr', 1, app.config['ADMISSION_ID_OCR_LIMIT'],
+                 app.config['ADMISSION_ID_OCR_DEADLINE'], app.config['ADMISSION_QUEUE_SIZE']),
+        Workload('bulk_ocr', 2, app.config['ADMISSION_BULK_OCR_LIMIT'],
+                 app.config['ADMISSION_BULK_OCR_DEADLINE'], app.config['ADMISSION_QUEUE_SIZE'])
+    ],
+    capacity=app.config['ADMISSION_CAPACITY'],
+    retry_after=app.config['OCR_RETRY_AFTER']
+)
+
+# Identical uploads to the same endpoint (double submits, client retries)
+# share one in-flight computation
+coalescer = SingleFlight()
+
+# Threads that wait on OCR/face work so a single request can fan out
+fanout_executor = ThreadPoolExecutor(
+    max_workers=app.config['OCR_QUEUE_SIZE'],
+    thread_name_prefix='fanout'
+)
+
+def cache_stat_collector(stat):
+    """Expose one ContentCache counter of every cache as labelled samples"""
+    caches = {'face_encodings': face_encoding_cache, 'ocr_results': ocr_result_cache}
+    return lambda: {(('cache', name),): cache.stats()[stat] for name, cache in caches.items()}
+
+metrics.register_collector('cache_hits_total', 'counter', cache_stat_collector('hits'), 'Memory-tier cache hits')
+metrics.register_collector('cache_disk_hits_total', 'counter', cache_stat_collector('disk_hits'), 'Disk-tier cache hits')
+metrics.register_collector('cache_misses_total', 'counter', cache_stat_collector('misses'), 'Cache misses')
+metrics.register_collector('cache_evictions_total', 'counter', cache_stat_collector('evictions'), 'Cache LRU evictions')
+metrics.register_collector('cache_entries', 'gauge', cache_stat_collector('size'), 'Entries in the memory tier')
+metrics.register_collector('ocr_queue_depth', 'gauge', lambda: {(): ocr.pending}, 'OCR tasks queued or running')
+metrics.register_collector('jobs_stored', 'gauge', lambda: {(): len(jobs)}, 'Asynchronous jobs kept in the job store')
+metrics.register_collector('coalesced_in_flight', 'gauge', lambda: {(): coalescer.in_flight}, 'Coalescable computations currently in flight')
+metrics.register_collector(
+    'admission_running', 'gauge',
+    lambda: {(('workload', name),): stats['running'] for name, stats in scheduler.stats().items()},
+    'Admitted requests running per workload class'
+)
+metrics.register_collector(
+    'admission_queued', 'gauge',
+    lambda: {(('workload', name),): stats['queued'] for name, stats in scheduler.stats().items()},
+    'Requests waiting for admission per workload class'
+)
+metrics.register_collector('face_queue_depth', 'gauge', lambda: {(): face_executor.pending}, 'Face tasks queued or running')
+
+def submit_fanout(fn, *args):
+    """Run fn on the fan-out pool, carrying over the request's timing context"""
+    context = contextvars.copy_context()
+    return fanout_executor.submit(context.run, fn, *args)
+
+def submit_face(fn, *args):
+    """Run face work on the bounded face pool; raises QueueFullError when it is saturated"""
+    context = contextvars.copy_context()
+    return face_executor.submit(context.run, fn, *args)
+
+def admitted(workload, fn):
+    """Wrap fn so it only runs once the scheduler admits it as workload"""
+    def run(*args):
+        with scheduler.admit(workload):
+            return fn(*args)
+    return run
+
+def ocr_workload(upload):
+    """PDFs are bulk work; single images are ID cards/scans read during verification"""
+    return 'bulk_ocr' if upload.is_pdf else 'id_ocr'
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def busy_response(error):
+    """Build a 429 (queue full) or 503 (shed after waiting) response telling the client when to retry"""
+    response = jsonify({
+        'success': False,
+        'error': 'Server is busy, please retry later'
+    })
+    response.status_code = error.status_code
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
 def save_uploaded_file(file):
-    """Save uploaded file and return the path"""
+    """Read an uploaded file into memory (spooling large ones to disk) and return it"""
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{timestamp}_{filename}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        return filepath
+        with metrics.stage('upload_read'):
+            return read_upload(
+                file,
+                spool_threshold=app.config['UPLOAD_SPOOL_THRESHOLD'],
+                spool_dir=app.config['UPLOAD_FOLDER']
+            )
     return None
 
 def cleanup_files(files):
-    """Clean up temporary files"""
+    """Release uploaded files and any temporary files backing them"""
     for file in files:
         try:
-            if file and os.path.exists(file):
-                os.remove(file)
+            if file:
+                file.close()
         except Exception as e:
-            logger.error(f"Error cleaning up file {file}: {str(e)}")
+            logger.error(f"Error cleaning up file {file.filename}: {str(e)}")
 
-def extracting_now_text(image_path):
+def extracting_now_text(upload):
     """Extract text from an image or PDF and return organized text line by line."""
     try:
-        if image_path.lower().endswith('.pdf'):
-            # Process PDF: Convert each page to an image
-            pdf_doc = fitz.open(image_path)
+        if upload.is_pdf:
             text_lines = []
 
-            for page_number in range(len(pdf_doc)):
-                page = pdf_doc[page_number]
-                pix = page.get_pixmap()
-                image = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
-                # Convert image to BGR for PaddleOCR
-                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-                ocr_result = ocr.ocr(image)
-                
-                # Extract lines of text
-                for line in ocr_result[0]:
-                    text_lines.append(line[1][0])
+            for boxes in ocr_engine.iter_pdf_boxes(upload):
+                text_lines.extend(box.text for box in boxes)
 
             return {"lines": text_lines}
 
         else:
             # Process image files (JPG, PNG, etc.)
-            image = cv2.imread(image_path)
-            if image is None:
-                raise ValueError("Could not read image")
-
-            result = ocr.ocr(image)
-            if not result or not result[0]:
-                return {"lines": []}
+            result = ocr_engine.recognize_image(upload)
 
             # Extract lines of text
-            text_lines = [line[1][0] for line in result[0]]
+            text_lines = [line[1][0] for line in result]
 
             return {"lines": text_lines}
 
@@ -99,105 +332,212 @@ def extracting_now_text(image_path):
         logger.error(f"Error in OCR processing: {str(e)}")
         raise
 
+def ordered_text_list(boxes):
+    """Return [{"order", "text"}] for the boxes, sorted top to bottom"""
+    # Sort by vertical position (top to bottom)
+    boxes = sorted(boxes, key=lambda box: box.y0)
+    return [{"order": idx, "text": box.text} for idx, box in enumerate(boxes, 1)]
+
+def fill_carte_grise_fields(boxes, structured_data):
+    """Fill still-empty carte grise fields from one page (or image) worth of boxes"""
+    for field, value in carte_grise_pairer.pair(boxes).items():
+        if structured_data[field] is None:
+            structured_data[field] = value
+    return structured_data
+
+def read_carte_grise(upload, on_page=None, engine=None):
+    """
+    OCR a carte grise and pair each label with its value by layout.
+    Returns (structured_data, lines); lines is the ordered text list for
+    images and None for PDFs, whose pages stop being read once every field is found.
+    on_page(page_number, boxes) is called as each PDF page is read; engine
+    defaults to the service's OCREngine.
+    """
+    engine = engine or ocr_engine
+    structured_data = {field: None for field in CARTE_GRISE_FIELDS}
+
+    if upload.is_pdf:
+        for page_number, boxes in enumerate(engine.iter_pdf_boxes(upload), 1):
+            fill_carte_grise_fields(boxes, structured_data)
+            if on_page:
+                on_page(page_number, boxes)
+
+            # Stop reading pages once every field has a value
+            if all(structured_data.values()):
+                break
+
+        return structured_data, None
+
+    boxes = boxes_from_paddle(engine.recognize_image(upload))
+    fill_carte_grise_fields(boxes, structured_data)
+    return structured_data, ordered_text_list(boxes)
+
 
 
 
 
 """Extraction for carte grise"""
-def extract_text_from_image(image_path):
+def extract_text_from_image(upload):
    
     try:
-        if image_path.lower().endswith('.pdf'):
-            # Process PDF: Convert each page to an image
-            pdf_doc = fitz.open(image_path)
-            text_lines = []
-
-            for page_number in range(len(pdf_doc)):
-                page = pdf_doc[page_number]
-                pix = page.get_pixmap()
-                image = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
-                # Convert image to BGR for PaddleOCR
-                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-                ocr_result = ocr.ocr(image)
-                
-                # Extract lines of text
-                for line in ocr_result[0]:
-                    text_lines.append(line[1][0])
-
-            structured_data = {
-            "Marque": None,
-            "Genre": None,
-            "Modele": None,
-            "Numero d'immatriculation": None,
-            "Type carburant": None,
-            "N du chassis": None,
-            "Adresse": None,
-            "Fin de validite": None
-            }
-
-            # Mapping logic to fill structured fields
-            for i, line in enumerate(text_lines):
-                line_lower = line.lower()
-
-                if "marque" in line_lower:
-                    structured_data["Marque"] = text_lines[i + 1] if i + 1 < len(text_lines) else None
-                elif "genre" in line_lower:
-                    structured_data["Genre"] = text_lines[i + 1] if i + 1 < len(text_lines) else None
-                elif "modele" in line_lower:
-                    structured_data["Modele"] = text_lines[i + 1] if i + 1 < len(text_lines) else None
-                elif "numero d'immatriculation" in line_lower or "numero dmatncuaton" in line_lower:
-                    structured_data["Numero d'immatriculation"] = text_lines[i + 1] if i + 1 < len(text_lines) else None
-                elif "type carburant" in line_lower:
-                    structured_data["Type carburant"] = text_lines[i + 1] if i + 1 < len(text_lines) else None
-                elif "n du chassis" in line_lower:
-                    structured_data["N du chassis"] = text_lines[i + 1] if i + 1 < len(text_lines) else None
-                elif "adresse" in line_lower:
-                    structured_data["Adresse"] = " ".join(text_lines[i + 1 : i + 4])  # Combine next lines for full address
-                elif "fin de validite" in line_lower:
-                    structured_data["Fin de validite"] = text_lines[i + 1] if i + 1 < len(text_lines) else None
-
-            return structured_data
-            
+        structured_data, _ = read_carte_grise(upload)
+        return structured_data
 
-        else:
-            image = cv2.imread(image_path)
-            if image is None:
-                raise ValueError("Could not read image")
+    except Exception as e:
+        logger.error(f"Error in OCR processing: {str(e)}")
+        raise
 
-            result = ocr.ocr(image)
-            
-            if not result or not result[0]:
-                return []
+def extract_id_card_lines(upload, side=None, engine=None):
+    """
+    OCR one side of an ID card and return its text lines ordered top to bottom.
+    When side ('front' or 'back') is given, the template fast path is tried first.
+    """
+    engine = engine or ocr_engine
+    try:
+        if side and not upload.is_pdf:
+            lines = engine.recognize_card_regions(upload, side, app.config['ID_TEMPLATE_MIN_CONFIDENCE'])
+            if lines is not None:
+                return lines
 
-            # Create simple list with just text and order
+        if upload.is_pdf:
             text_list = []
-            for idx, line in enumerate(result[0], 1):
-                text = line[1][0]  # Get just the text
-                # Get y-coordinate of the text box for vertical ordering
-                y_coord = line[0][0][1]  # Get y-coordinate of first point
-                text_list.append({
-                    "order": idx,
-                    "text": text,
-                    "y_coord": y_coord  # We'll use this for sorting
-                })
-
-            # Sort by vertical position (top to bottom)
-            text_list.sort(key=lambda x: x["y_coord"])
-            
-            # Remove y_coord and reassign order numbers after sorting
-            final_list = []
-            for idx, item in enumerate(text_list, 1):
-                final_list.append({
-                    "order": idx,
-                    "text": item["text"]
-                })
-
-            return final_list
+            for boxes in engine.iter_pdf_boxes(upload):
+                text_list.extend(ordered_text_list(boxes))
+            return [{"order": idx, "text": item["text"]} for idx, item in enumerate(text_list, 1)]
+
+        return ordered_text_list(boxes_from_paddle(engine.recognize_image(upload)))
 
     except Exception as e:
         logger.error(f"Error in OCR processing: {str(e)}")
         raise
 
+def parse_id_card(front_file, back_file, use_template, engine=None):
+    """OCR both sides of an ID card concurrently and parse them with IDCardProcessor"""
+    front_side, back_side = ('front', 'back') if use_template else (None, None)
+
+    # OCR both sides concurrently, each on its own OCR worker
+    back_future = submit_fanout(extract_id_card_lines, back_file, back_side, engine)
+    front_text = extract_id_card_lines(front_file, front_side, engine)
+    back_text = back_future.result()
+
+    id_processor = IDCardProcessor()
+    with metrics.stage('id_parse'):
+        return id_processor.process_id_card(front_text, back_text)
+
+def read_id_card(front_file, back_file, engine=None):
+    """
+    Read an ID card through the template fast path when enabled. If that leaves
+    fields missing, both sides are read again with full detection (a side that
+    already fell back to it is served from the OCR cache).
+    """
+    use_template = app.config['ID_TEMPLATE_OCR']
+    result = parse_id_card(front_file, back_file, use_template, engine)
+    if result['success'] or not use_template:
+        return result
+    return parse_id_card(front_file, back_file, False, engine)
+
+@app.before_request
+def start_request_timer():
+    """Start timing the request; ?timings=1 or X-Timings: 1 also collects a stage breakdown"""
+    g.request_start = time.perf_counter()
+    if request.args.get('timings') == '1' or request.headers.get('X-Timings') == '1':
+        g.stage_breakdown = metrics.start_breakdown()
+    else:
+        metrics.stop_breakdown()
+
+@app.after_request
+def record_request_metrics(response):
+    """Count the request and attach the stage breakdown when one was asked for"""
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+
+    metrics.inc('requests_total', help='Requests by endpoint and status', endpoint=endpoint, status=response.status_code)
+    metrics.observe('request_duration_seconds', elapsed, help='End-to-end request latency', endpoint=endpoint)
+    if response.status_code >= 400:
+        metrics.inc('errors_total', help='Requests answered with an error status', endpoint=endpoint, status=response.status_code)
+
+    breakdown = g.get('stage_breakdown')
+    if breakdown is not None and response.is_json:
+        body = response.get_json(silent=True)
+        if isinstance(body, dict):
+            body['stage_timings_ms'] = dict(breakdown, total=round(elapsed * 1000, 2))
+            response.set_data(app.json.dumps(body))
+
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def extract_text_payload(upload, on_page=None):
+    """Build the /api/extract-text response body for one carte grise upload"""
+    structured_data, lines = read_carte_grise(upload, on_page)
+
+    response = {
+        'success': True,
+        'text_count': len(structured_data),
+        'extracted_text': structured_data
+    }
+    if lines is not None:
+        # Ordered OCR lines of images, as consumed by the ID verification step
+        response['lines'] = lines
+    return response
+
+def verify_identity_payload(selfie_file, front_file, back_file):
+    """Build the /api/verify-identity response body"""
+    # The front image is decoded once and shared by face comparison and OCR
+    face_future = submit_face(face_comparator.compare_faces, front_file, selfie_file)
+    id_result = read_id_card(front_file, back_file)
+    face_result = face_future.result()
+
+    # Force convert any potential numpy bool_ to Python bool
+    if 'match' in face_result:
+        face_result['match'] = True if face_result['match'] else False
+
+    return {
+        'success': bool(face_result.get('success') and face_result.get('match') and id_result['success']),
+        'face': face_result,
+        'id_card': id_result
+    }
+
+def extract_text_job(job, upload):
+    """Job body of /api/jobs/extract-text; publishes each PDF page as it is read"""
+    def on_page(page_number, boxes):
+        job.add_partial({
+            'page': page_number,
+            'fields': carte_grise_pairer.pair(boxes),
+            'lines': ordered_text_list(boxes)
+        })
+
+    # Jobs are asynchronous already, so they wait for a slot without a deadline
+    with scheduler.admit(ocr_workload(upload), deadline=None):
+        return extract_text_payload(upload, on_page)
+
+def verify_identity_job(job, selfie_file, front_file, back_file):
+    """Job body of /api/jobs/verify-identity"""
+    with scheduler.admit('id_ocr', deadline=None):
+        return verify_identity_payload(selfie_file, front_file, back_file)
+
+def submit_job(kind, fn, saved_files):
+    """
+    Queue fn(job, *saved_files) and answer 202 with the job id.
+    The uploads are handed over to the job, which releases them when it ends.
+    Raises ValueError when webhook_url does not point to localhost.
+    """
+    webhook = request.form.get('webhook_url')
+    if webhook and not is_local_url(webhook):
+        raise ValueError('webhook_url must point to localhost')
+
+    job = jobs.submit(kind, fn, *saved_files, webhook=webhook,
+                      on_done=lambda: cleanup_files(saved_files))
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/api/jobs/{job.id}'
+    }), 202
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -206,6 +546,24 @@ def health_check():
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness endpoint: 503 until the face and OCR models are loaded and warm"""
+    # Starting here keeps the models out of import time (the OCR pool spawns
+    # children that re-import this module)
+    warmup.start()
+    status = warmup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    """Report hit/miss/eviction counters of the in-process caches"""
+    return jsonify({
+        'success': True,
+        'face_encodings': face_encoding_cache.stats(),
+        'ocr_results': ocr_result_cache.stats()
+    })
+
 @app.route('/api/compare-faces', methods=['POST'])
 def compare_faces():
     """Compare faces in two uploaded images"""
@@ -221,18 +579,21 @@ def compare_faces():
         image1 = request.files['image1']
         image2 = request.files['image2']
 
-        image1_path = save_uploaded_file(image1)
-        image2_path = save_uploaded_file(image2)
-        saved_files = [image1_path, image2_path]
+        image1_file = save_uploaded_file(image1)
+        image2_file = save_uploaded_file(image2)
+        saved_files = [image1_file, image2_file]
 
-        if not image1_path or not image2_path:
+        if not image1_file or not image2_file:
             return jsonify({
                 'success': False,
                 'error': 'Invalid file format. Allowed formats: png, jpg, jpeg'
             }), 400
 
-        face_comparator = FaceComparator(similarity_threshold=0.4)
-        result = face_comparator.compare_faces(image1_path, image2_path)
+        result = coalescer.do(
+            'compare-faces',
+            (image1_file.digest, image2_file.digest),
+            admitted('interactive', lambda: submit_face(face_comparator.compare_faces, image1_file, image2_file).result())
+        )
         
         # Force convert any potential numpy bool_ to Python bool
         if 'match' in result:
@@ -240,6 +601,9 @@ def compare_faces():
         
         return jsonify(result)
 
+    except QueueFullError as e:
+        return busy_response(e)
+
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}", exc_info=True)
         return jsonify({
@@ -250,6 +614,239 @@ def compare_faces():
     finally:
         cleanup_files(saved_files)
 
+@app.route('/api/compare-faces/burst', methods=['POST'])
+def compare_faces_burst():
+    """Compare a reference image against several webcam frames in one request"""
+    saved_files = []
+
+    try:
+        frames = request.files.getlist('frames')
+        if 'reference' not in request.files or not frames:
+            return jsonify({
+                'success': False,
+                'error': 'A reference image and at least one frame must be provided'
+            }), 400
+
+        if len(frames) > app.config['FACE_BURST_MAX_FRAMES']:
+            return jsonify({
+                'success': False,
+                'error': f"At most {app.config['FACE_BURST_MAX_FRAMES']} frames may be provided"
+            }), 400
+
+        reference_file = save_uploaded_file(request.files['reference'])
+        frame_files = [save_uploaded_file(frame) for frame in frames]
+        saved_files = [reference_file] + frame_files
+
+        if not all(saved_files):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid file format. Allowed formats: png, jpg, jpeg'
+            }), 400
+
+        with scheduler.admit('interactive'):
+            result = submit_face(face_comparator.compare_burst, reference_file, frame_files).result()
+        return jsonify(result)
+
+    except QueueFullError as e:
+        return busy_response(e)
+
+    except Exception as e:
+        logger.error(f"Error processing request: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': f'Error processing request: {str(e)}'
+        }), 500
+
+    finally:
+        cleanup_files(saved_files)
+
+def is_admin_request():
+    """Whether the request carries the configured FACE_ADMIN_TOKEN"""
+    token = app.config['FACE_ADMIN_TOKEN']
+    provided = request.headers.get('X-Admin-Token', '')
+    return bool(token) and hmac.compare_digest(provided.encode('utf-8'), token.encode('utf-8'))
+
+@app.route('/api/faces/enroll', methods=['POST'])
+def enroll_face():
+    """
+    Store the face encoding of a user for login verification and 1:N search.
+    A user is enrolled once (409 afterwards); replace=1 overwrites the
+    template and is only accepted from admin requests.
+    """
+    saved_files = []
+
+    try:
+        user_id = request.form.get('user_id', '').strip()
+        if not user_id or 'image' not in request.files:
+            return jsonify({
+                'success': False,
+                'error': 'Both user_id and image must be provided'
+            }), 400
+
+        replace = request.form.get('replace') == '1'
+        if replace and not is_admin_request():
+            return jsonify({
+                'success': False,
+                'error': 'Replacing an enrolled face requires a valid X-Admin-Token'
+            }), 403
+
+        # Checked again atomically by enroll; this only skips encoding a doomed upload
+        if not replace and user_id in face_index:
+            raise AlreadyEnrolledError(user_id)
+
+        image_file = save_uploaded_file(request.files['image'])
+        saved_files = [image_file]
+
+        if not image_file:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid file format. Allowed formats: png, jpg, jpeg'
+            }), 400
+
+        with scheduler.admit('interactive'):
+            encoding, location = submit_face(face_comparator.get_face_encoding, image_file).result()
+        face_index.enroll(user_id, encoding, replace=replace)
+
+        return jsonify({
+            'success': True,
+            'user_id': user_id,
+            'face_location': [int(i) for i in location],
+            'enrolled_count': len(face_index)
+        })
+
+    except QueueFullError as e:
+        return busy_response(e)
+
+    except AlreadyEnrolledError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status_code
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    except Exception as e:
+        logger.error(f"Error enrolling face: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': f'Error enrolling face: {str(e)}'
+        }), 500
+
+    finally:
+        cleanup_files(saved_files)
+
+@app.route('/api/verify-face/<user_id>', methods=['POST'])
+def verify_face(user_id):
+    """Compare a live frame against the enrolled template of user_id (only the frame is encoded)"""
+    saved_files = []
+
+    try:
+        if 'image' not in request.files:
+            return jsonify({
+                'success': False,
+                'error': 'No image file provided'
+            }), 400
+
+        template = face_index.get(user_id)
+        if template is None:
+            return jsonify({
+                'success': False,
+                'error': 'No face enrolled for this user'
+            }), 404
+
+        image_file = save_uploaded_file(request.files['image'])
+        saved_files = [image_file]
+
+        if not image_file:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid file format. Allowed formats: png, jpg, jpeg'
+            }), 400
+
+        with scheduler.admit('interactive'):
+            result = submit_face(face_comparator.compare_to_template, template, image_file).result()
+
+        return jsonify(dict(result, user_id=user_id))
+
+    except QueueFullError as e:
+        return busy_response(e)
+
+    except Exception as e:
+        logger.error(f"Error verifying face: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': f'Error verifying face: {str(e)}'
+        }), 500
+
+    finally:
+        cleanup_files(saved_files)
+
+@app.route('/api/faces/search', methods=['POST'])
+def search_faces():
+    """Return the enrolled users whose faces are closest to the uploaded one"""
+    saved_files = []
+
+    try:
+        if 'image' not in request.files:
+            return jsonify({
+                'success': False,
+                'error': 'No image file provided'
+            }), 400
+
+        k = min(request.form.get('k', 5, type=int), app.config['FACE_SEARCH_MAX_K'])
+
+        image_file = save_uploaded_file(request.files['image'])
+        saved_files = [image_file]
+
+        if not image_file:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid file format. Allowed formats: png, jpg, jpeg'
+            }), 400
+
+        with scheduler.admit('interactive'):
+            encoding, location = submit_face(face_comparator.get_face_encoding, image_file).result()
+
+        matches = []
+        for user_id, distance in face_index.search(encoding, k):
+            confidence = 1 - distance
+            matches.append({
+                'user_id': user_id,
+                'distance': round(distance, 4),
+                'confidence': float(round(confidence * 100, 2)),
+                'match': confidence >= face_comparator.similarity_threshold
+            })
+
+        return jsonify({
+            'success': True,
+            'face_location': [int(i) for i in location],
+            'enrolled_count': len(face_index),
+            'matches': matches
+        })
+
+    except QueueFullError as e:
+        return busy_response(e)
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    except Exception as e:
+        logger.error(f"Error searching faces: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': f'Error searching faces: {str(e)}'
+        }), 500
+
+    finally:
+        cleanup_files(saved_files)
+
 @app.route('/api/process-id-card', methods=['POST'])
 def process_id_card():
     saved_files = []
@@ -264,24 +861,24 @@ def process_id_card():
         front_image = request.files['front_image']
         back_image = request.files['back_image']
         
-        front_image_path = save_uploaded_file(front_image)
-        back_image_path = save_uploaded_file(back_image)
-        saved_files = [front_image_path, back_image_path]
+        front_file = save_uploaded_file(front_image)
+        back_file = save_uploaded_file(back_image)
+        saved_files = [front_file, back_file]
 
-        if not front_image_path or not back_image_path:
+        if not front_file or not back_file:
             return jsonify({
                 'success': False,
                 'error': 'Invalid file format. Allowed formats: png, jpg, jpeg'
             }), 400
 
-        front_text = extract_text_from_image(front_image_path)
-        back_text = extract_text_from_image(back_image_path)
-
-        id_processor = IDCardProcessor()
-        result = id_processor.process_id_card(front_text, back_text)
+        result = coalescer.do('process-id-card', (front_file.digest, back_file.digest),
+                              admitted('id_ocr', read_id_card), front_file, back_file)
         
         return jsonify(result)
 
+    except QueueFullError as e:
+        return busy_response(e)
+
     except Exception as e:
         logger.error(f"Error processing ID card: {str(e)}", exc_info=True)
         return jsonify({
@@ -293,6 +890,49 @@ def process_id_card():
         cleanup_files(saved_files)
 
 
+@app.route('/api/verify-identity', methods=['POST'])
+def verify_identity():
+    """Compare the selfie with the ID photo and read both ID sides in a single call"""
+    saved_files = []
+    try:
+        if any(field not in request.files for field in ('selfie', 'front_image', 'back_image')):
+            return jsonify({
+                'success': False,
+                'error': 'selfie, front_image and back_image must all be provided'
+            }), 400
+
+        selfie_file = save_uploaded_file(request.files['selfie'])
+        front_file = save_uploaded_file(request.files['front_image'])
+        back_file = save_uploaded_file(request.files['back_image'])
+        saved_files = [selfie_file, front_file, back_file]
+
+        if not all(saved_files):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid file format. Allowed formats: png, jpg, jpeg'
+            }), 400
+
+        result = coalescer.do(
+            'verify-identity',
+            (selfie_file.digest, front_file.digest, back_file.digest),
+            admitted('id_ocr', verify_identity_payload), selfie_file, front_file, back_file
+        )
+        return jsonify(result)
+
+    except QueueFullError as e:
+        return busy_response(e)
+
+    except Exception as e:
+        logger.error(f"Error verifying identity: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': f'Error verifying identity: {str(e)}'
+        }), 500
+
+    finally:
+        cleanup_files(saved_files)
+
+
 @app.route('/api/extract-text', methods=['POST'])
 def extract_text():
     """Extract text from uploaded image using PaddleOCR"""
@@ -306,22 +946,21 @@ def extract_text():
             }), 400
 
         image = request.files['image']
-        image_path = save_uploaded_file(image)
-        saved_files = [image_path]
+        image_file = save_uploaded_file(image)
+        saved_files = [image_file]
 
-        if not image_path:
+        if not image_file:
             return jsonify({
                 'success': False,
                 'error': 'Invalid file format. Allowed formats: png, jpg, jpeg'
             }), 400
 
-        text_list = extract_text_from_image(image_path)
-        
-        return jsonify({
-            'success': True,
-            'text_count': len(text_list),
-            'extracted_text': text_list
-        })
+        result = coalescer.do('extract-text', (image_file.digest,),
+                              admitted(ocr_workload(image_file), extract_text_payload), image_file)
+        return jsonify(result)
+
+    except QueueFullError as e:
+        return busy_response(e)
 
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
@@ -346,16 +985,17 @@ def extracting_text():
             }), 400
 
         image = request.files['image']
-        image_path = save_uploaded_file(image)
-        saved_files = [image_path]
+        image_file = save_uploaded_file(image)
+        saved_files = [image_file]
 
-        if not image_path:
+        if not image_file:
             return jsonify({
                 'success': False,
                 'error': 'Invalid file format. Allowed formats: png, jpg, jpeg'
             }), 400
 
-        text_list = extracting_now_text(image_path)
+        text_list = coalescer.do('extracting-text', (image_file.digest,),
+                                 admitted(ocr_workload(image_file), extracting_now_text), image_file)
         
         return jsonify({
             'success': True,
@@ -363,6 +1003,9 @@ def extracting_text():
             'extracted_text': text_list
         })
 
+    except QueueFullError as e:
+        return busy_response(e)
+
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
         return jsonify({
@@ -373,5 +1016,113 @@ def extracting_text():
     finally:
         cleanup_files(saved_files)
 
+@app.route('/api/jobs/extract-text', methods=['POST'])
+def submit_extract_text_job():
+    """Queue /api/extract-text work and return a job id to poll"""
+    saved_files = []
+
+    try:
+        if 'image' not in request.files:
+            return jsonify({
+                'success': False,
+                'error': 'No image file provided'
+            }), 400
+
+        image_file = save_uploaded_file(request.files['image'])
+        saved_files = [image_file]
+
+        if not image_file:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid file format. Allowed formats: png, jpg, jpeg'
+            }), 400
+
+        response = submit_job('extract-text', extract_text_job, saved_files)
+        saved_files = []
+        return response
+
+    except QueueFullError as e:
+        return busy_response(e)
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    except Exception as e:
+        logger.error(f"Error submitting job: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': f'Error submitting job: {str(e)}'
+        }), 500
+
+    finally:
+        cleanup_files(saved_files)
+
+@app.route('/api/jobs/verify-identity', methods=['POST'])
+def submit_verify_identity_job():
+    """Queue /api/verify-identity work and return a job id to poll"""
+    saved_files = []
+
+    try:
+        if any(field not in request.files for field in ('selfie', 'front_image', 'back_image')):
+            return jsonify({
+                'success': False,
+                'error': 'selfie, front_image and back_image must all be provided'
+            }), 400
+
+        saved_files = [
+            save_uploaded_file(request.files['selfie']),
+            save_uploaded_file(request.files['front_image']),
+            save_uploaded_file(request.files['back_image'])
+        ]
+
+        if not all(saved_files):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid file format. Allowed formats: png, jpg, jpeg'
+            }), 400
+
+        response = submit_job('verify-identity', verify_identity_job, saved_files)
+        saved_files = []
+        return response
+
+    except QueueFullError as e:
+        return busy_response(e)
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    except Exception as e:
+        logger.error(f"Error submitting job: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': f'Error submitting job: {str(e)}'
+        }), 500
+
+    finally:
+        cleanup_files(saved_files)
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Return the status, per-page partial results and final output of a job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Unknown or expired job'
+        }), 404
+
+    return jsonify({'success': True, **job.to_dict()})
+
 if __name__ == '__main__':
+    # Development server only; production runs under gunicorn (see
+    # gunicorn.conf.py). Warm the models in the background while already
+    # serving /health and /ready; the OCR pool uses the spawn start method,
+    # so this must not run at import time
+    warmup.start()
     app.run(host='0.0.0.0', port=8080)
@@ -0,0 +1,129 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Per-request {stage: milliseconds}, set only when a client asked for a timing breakdown
+_breakdown = contextvars.ContextVar('stage_breakdown', default=None)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{key}="{str(value)}"' for key, value in labels)
+    return '{' + pairs + '}'
+
+
+class Metrics:
+    """
+    Minimal in-process metrics registry rendered in the Prometheus text format.
+    Counters and histograms are recorded directly; collectors are callbacks
+    evaluated at scrape time for values owned by other objects (cache
+    counters, queue depth).
+    """
+
+    def __init__(self, namespace='vision', buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._help = {}
+
+    def inc(self, name, amount=1, help='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ('counter', help))
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, help='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ('histogram', help))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def register_collector(self, name, kind, fn, help=''):
+        """Register fn() -> {labels_dict_items_tuple: value} evaluated on every scrape"""
+        with self._lock:
+            self._help[name] = (kind, help)
+            self._collectors.append((name, fn))
+
+    @contextmanager
+    def stage(self, name):
+        """Time a processing stage into the stage histogram and the request breakdown"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.perf_counter() - start)
+
+    def record_stage(self, name, seconds):
+        self.observe('stage_duration_seconds', seconds, help='Time spent per processing stage', stage=name)
+        breakdown = _breakdown.get()
+        if breakdown is not None:
+            breakdown[name] = round(breakdown.get(name, 0.0) + seconds * 1000, 2)
+
+    def start_breakdown(self):
+        """Start collecting a per-request stage breakdown in the current context"""
+        breakdown = {}
+        _breakdown.set(breakdown)
+        return breakdown
+
+    def stop_breakdown(self):
+        """Stop collecting a breakdown in the current context (threads may be reused across requests)"""
+        _breakdown.set(None)
+
+    def current_breakdown(self):
+        return _breakdown.get()
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(h[0]), h[1], h[2]) for key, h in self._histograms.items()}
+            collectors = list(self._collectors)
+            help_texts = dict(self._help)
+
+        samples = {}
+        for (name, labels), value in counters.items():
+            samples.setdefault(name, []).append((name, labels, value))
+
+        for (name, labels), (bucket_counts, total, count) in histograms.items():
+            lines = samples.setdefault(name, [])
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append((f"{name}_bucket", labels + (('le', repr(float(bound))),), cumulative))
+            lines.append((f"{name}_bucket", labels + (('le', '+Inf'),), count))
+            lines.append((f"{name}_sum", labels, total))
+            lines.append((f"{name}_count", labels, count))
+
+        for name, fn in collectors:
+            for labels, value in fn().items():
+                samples.setdefault(name, []).append((name, labels, value))
+
+        output = []
+        for name in sorted(samples):
+            kind, help_text = help_texts.get(name, ('untyped', ''))
+            full_name = f"{self.namespace}_{name}"
+            if help_text:
+                output.append(f"# HELP {full_name} {help_text}")
+            output.append(f"# TYPE {full_name} {kind}")
+            for sample_name, labels, value in samples[name]:
+                output.append(f"{self.namespace}_{sample_name}{_format_labels(labels)} {value}")
+        return '\n'.join(output) + '\n'
+
+
+# Process-wide registry shared by the service modules
+metrics = Metrics()
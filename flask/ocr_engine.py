@@ -0,0 +1,116 @@
+import hashlib
+from pdf_pipeline import iter_pdf_pages
+from metrics import metrics
+from id_card_template import find_card_quad, normalize_card, crop_regions, recognize_crops, template_lines
+
+
+def _mean_confidence(lines):
+    if not lines:
+        return 0.0
+    return sum(float(line[1][1]) for line in lines) / len(lines)
+
+
+class OCREngine:
+    """
+    Single OCR entry point shared by every text-extraction path.
+    Image results and OCR'd PDF pages are cached by upload content hash plus
+    the OCR parameters, so re-uploading the same document skips inference.
+    """
+
+    def __init__(self, pool, cache=None, dpi=72, min_text_chars=16, window=2, angle_retry_confidence=0.0,
+                 max_image_coverage=0.5, full_text_chars=200):
+        self.pool = pool
+        self.cache = cache
+        self.dpi = dpi
+        self.min_text_chars = min_text_chars
+        self.max_image_coverage = max_image_coverage
+        self.full_text_chars = full_text_chars
+        self.window = window
+        self.angle_retry_confidence = angle_retry_confidence
+
+        # Results depend on the model settings, so they are part of every key
+        params = repr((sorted(pool.ocr_kwargs.items()), sorted(pool.call_kwargs.items()),
+                       angle_retry_confidence, dpi))
+        self.params_key = hashlib.sha256(params.encode('utf-8')).hexdigest()[:16]
+
+    def recognize_image(self, upload):
+        """
+        OCR an uploaded image.
+        Returns PaddleOCR lines: [[box, (text, confidence)], ...]
+        """
+        key = f"{upload.digest}:image:{self.params_key}"
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        image = upload.decode_image()
+        result = self.pool.ocr(image)
+        lines = result[0] if result and result[0] else []
+
+        # The angle classifier runs only when the upright read looks poor
+        # (e.g. an upside-down scan)
+        if self.angle_retry_confidence and _mean_confidence(lines) < self.angle_retry_confidence:
+            with metrics.stage('ocr_angle_retry'):
+                result = self.pool.ocr(image, cls=True)
+            retried = result[0] if result and result[0] else []
+            if _mean_confidence(retried) > _mean_confidence(lines):
+                lines = retried
+
+        if self.cache is not None:
+            self.cache.put(key, lines)
+        return lines
+
+    def recognize_card_regions(self, upload, side, min_confidence=0.7):
+        """
+        Fast path for ID card images: deskew the card to its canonical size and
+        run recognition only on the known field regions of the given side.
+        Returns ordered lines like the full path, or None when the template does
+        not fit (no card outline, empty or low-confidence regions).
+        """
+        key = f"{upload.digest}:roi-{side}-{min_confidence}:{self.params_key}"
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                # False records a previous template miss
+                return cached or None
+
+        image = upload.decode_image()
+        with metrics.stage('id_card_normalize'):
+            quad = find_card_quad(image)
+            regions = crop_regions(normalize_card(image, quad), side) if quad is not None else None
+        lines = None
+
+        if regions is not None:
+            with metrics.stage('id_template_ocr'):
+                recognized = self.pool.submit(recognize_crops, [crop for _, crop in regions]).result()
+            lines = template_lines([field for field, _ in regions], recognized, min_confidence)
+
+        if self.cache is not None:
+            self.cache.put(key, lines if lines is not None else False)
+        return lines
+
+    def iter_pdf_boxes(self, upload):
+        """Yield the TextBoxes of each page of an uploaded PDF, in page order"""
+        pdf_doc = upload.open_pdf()
+        pages = iter_pdf_pages(
+            pdf_doc,
+            # Spooled uploads are opened by path in the workers instead of
+            # being read into memory and pickled with every page
+            None if upload.in_memory else upload.path,
+            self.pool,
+            dpi=self.dpi,
+            min_text_chars=self.min_text_chars,
+            max_image_coverage=self.max_image_coverage,
+            full_text_chars=self.full_text_chars,
+            window=self.window,
+            cache=self.cache,
+            cache_key=f"{upload.digest}:pdf-boxes:{self.params_key}"
+        )
+        try:
+            for _, boxes in pages:
+                yield boxes
+        finally:
+            # Cancel pages still queued when the caller stops early
+            pages.close()
+            pdf_doc.close()
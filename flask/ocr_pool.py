@@ -0,0 +1,122 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from executors import BoundedExecutor
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# PaddleOCR instance owned by the current worker (process or dedicated thread)
+# and the default keyword arguments of its ocr() calls
+_worker_ocr = None
+_worker_call_kwargs = {}
+
+
+def _init_worker(ocr_kwargs, call_kwargs=None):
+    """Load and warm up a PaddleOCR model once per worker"""
+    global _worker_ocr, _worker_call_kwargs
+    from paddleocr import PaddleOCR
+
+    _worker_ocr = PaddleOCR(**ocr_kwargs)
+    _worker_call_kwargs = dict(call_kwargs or {})
+    # The first inference initializes the predictors, so pay it here
+    _worker_ocr.ocr(np.full((64, 256, 3), 255, dtype=np.uint8))
+
+
+def worker_ocr(image, **kwargs):
+    """Run the current worker's model; only valid inside a task submitted to the pool"""
+    return _worker_ocr.ocr(image, **dict(_worker_call_kwargs, **kwargs))
+
+
+def _run_ocr(image, kwargs):
+    start = time.perf_counter()
+    result = worker_ocr(image, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _ping(hold):
+    # Holding the task briefly keeps a worker that is already up from
+    # draining every ping while the others are still loading their model
+    time.sleep(hold)
+    return os.getpid()
+
+
+class OCRWorkerPool:
+    """
+    Pool of OCR workers, each holding its own PaddleOCR model.
+    With workers > 0 every worker is a separate process, so inference scales
+    across cores. With workers == 0 a single in-process thread owns the model,
+    which keeps the old serialized behaviour for development.
+    At most queue_size requests may be queued or running; further submissions
+    raise QueueFullError so callers can answer 429.
+    """
+
+    def __init__(self, ocr_kwargs, workers=2, queue_size=16, retry_after=2, call_kwargs=None):
+        self.ocr_kwargs = ocr_kwargs
+        self.call_kwargs = call_kwargs or {}
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Create the workers and wait until every model is loaded"""
+        with self._lock:
+            if self._executor is not None:
+                return
+
+            if self.workers > 0:
+                executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.ocr_kwargs, self.call_kwargs)
+                )
+            else:
+                executor = ThreadPoolExecutor(
+                    max_workers=1,
+                    initializer=_init_worker,
+                    initargs=(self.ocr_kwargs, self.call_kwargs)
+                )
+
+            # A worker only takes tasks once its initializer has loaded the
+            # model, so keep pinging until every worker process has answered
+            worker_count = max(self.workers, 1)
+            ready = set()
+            while len(ready) < worker_count:
+                pings = [executor.submit(_ping, 0.05) for _ in range(worker_count)]
+                ready.update(future.result() for future in pings)
+
+            self._executor = BoundedExecutor(executor, self.queue_size, self.retry_after)
+            logger.info(f"OCR pool ready with {worker_count} worker(s)")
+
+    @property
+    def pending(self):
+        return self._executor.pending if self._executor is not None else 0
+
+    def submit(self, fn, *args):
+        """Run fn(*args) on an OCR worker; fn must be a module-level function"""
+        if self._executor is None:
+            self.start()
+        return self._executor.submit(fn, *args)
+
+    def ocr(self, image, **kwargs):
+        """Run PaddleOCR on a BGR image, with the same return value as PaddleOCR.ocr"""
+        submitted = time.perf_counter()
+        result, inference_time = self.submit(_run_ocr, image, kwargs).result()
+
+        # Whatever is not inference was spent queued or moving the image between processes
+        metrics.record_stage('ocr_queue_wait', max(0.0, time.perf_counter() - submitted - inference_time))
+        metrics.record_stage('ocr_inference', inference_time)
+        return result
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
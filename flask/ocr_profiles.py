@@ -0,0 +1,115 @@
+import os
+from collections import namedtuple
+
+# model_kwargs go to the PaddleOCR constructor; call_kwargs are the defaults
+# of every PaddleOCR.ocr call (an explicit keyword still wins, as the ID card
+# template path does with cls=False). With cls off by default the angle
+# classifier model is still loaded, and angle_retry_confidence makes
+# OCREngine re-run an image with cls=True only when the plain result's mean
+# confidence falls below it (0 disables the retry).
+OCRProfile = namedtuple('OCRProfile', ['name', 'model_kwargs', 'call_kwargs', 'angle_retry_confidence'])
+
+OCR_PROFILES = {
+    # The original configuration: default models, angle classifier on every call
+    'legacy': OCRProfile(
+        'legacy',
+        {'use_angle_cls': True, 'lang': 'en'},
+        {'cls': True},
+        0.0
+    ),
+    # PP-OCRv4 mobile det/rec models tuned for CPU-only nodes
+    'mobile': OCRProfile(
+        'mobile',
+        {
+            'use_angle_cls': True,
+            'lang': 'en',
+            'ocr_version': 'PP-OCRv4',
+            'use_gpu': False,
+            'enable_mkldnn': True,
+            'cpu_threads': 4,
+            'rec_batch_num': 16,
+            'det_limit_side_len': 960,
+            'det_limit_type': 'max',
+            'show_log': False
+        },
+        {'cls': False},
+        0.6
+    ),
+    # Larger server models; OCR_DET_MODEL_DIR / OCR_REC_MODEL_DIR must point
+    # to the downloaded server inference models (PaddleOCR would otherwise
+    # silently load its default mobile models)
+    'server': OCRProfile(
+        'server',
+        {
+            'use_angle_cls': True,
+            'lang': 'en',
+            'ocr_version': 'PP-OCRv4',
+            'use_gpu': False,
+            'enable_mkldnn': True,
+            'cpu_threads': 8,
+            'rec_batch_num': 8,
+            'det_limit_side_len': 1280,
+            'det_limit_type': 'max',
+            'show_log': False
+        },
+        {'cls': False},
+        0.6
+    )
+}
+
+# Model directories a profile cannot run without
+_REQUIRED_MODEL_DIRS = {
+    'server': ('det_model_dir', 'rec_model_dir')
+}
+
+# Environment overrides applied on top of the selected profile
+_INT_OVERRIDES = {
+    'OCR_CPU_THREADS': 'cpu_threads',
+    'OCR_REC_BATCH_NUM': 'rec_batch_num',
+    'OCR_DET_LIMIT_SIDE_LEN': 'det_limit_side_len'
+}
+_PATH_OVERRIDES = {
+    'OCR_DET_MODEL_DIR': 'det_model_dir',
+    'OCR_REC_MODEL_DIR': 'rec_model_dir',
+    'OCR_CLS_MODEL_DIR': 'cls_model_dir'
+}
+
+
+def load_profile(name, environ=os.environ):
+    """
+    Return the named profile with OCR_* environment overrides applied.
+    OCR_ANGLE_CLS=always|never|auto forces the per-call classifier default
+    (auto keeps the profile's); OCR_ENABLE_MKLDNN=0|1 toggles MKL-DNN.
+    Raises ValueError for an unknown profile or missing required model dirs.
+    """
+    if name not in OCR_PROFILES:
+        raise ValueError(f"Unknown OCR profile {name!r}; expected one of {', '.join(sorted(OCR_PROFILES))}")
+
+    profile = OCR_PROFILES[name]
+    model_kwargs = dict(profile.model_kwargs)
+    call_kwargs = dict(profile.call_kwargs)
+    angle_retry_confidence = profile.angle_retry_confidence
+
+    for variable, key in _INT_OVERRIDES.items():
+        if environ.get(variable):
+            model_kwargs[key] = int(environ[variable])
+    for variable, key in _PATH_OVERRIDES.items():
+        if environ.get(variable):
+            model_kwargs[key] = environ[variable]
+    if environ.get('OCR_ENABLE_MKLDNN'):
+        model_kwargs['enable_mkldnn'] = environ['OCR_ENABLE_MKLDNN'] == '1'
+
+    missing = [key for key in _REQUIRED_MODEL_DIRS.get(name, ()) if not model_kwargs.get(key)]
+    if missing:
+        variables = ', '.join(f"OCR_{key[:3].upper()}_MODEL_DIR" for key in missing)
+        raise ValueError(f"OCR profile {name!r} needs {variables} to point to its inference models")
+
+    angle = environ.get('OCR_ANGLE_CLS', 'auto')
+    if angle == 'always':
+        call_kwargs['cls'] = True
+        angle_retry_confidence = 0.0
+    elif angle == 'never':
+        call_kwargs['cls'] = False
+        angle_retry_confidence = 0.0
+
+    return OCRProfile(name, model_kwargs, call_kwargs, angle_retry_confidence)
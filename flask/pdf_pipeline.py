@@ -0,0 +1,133 @@
+from collections import deque
+from concurrent.futures import Future
+import cv2
+import numpy as np
+import fitz
+from ocr_pool import worker_ocr
+from layout import TextBox, boxes_from_paddle
+from metrics import metrics
+
+# Text extraction flags of read_text_layer: the 'dict' defaults without
+# TEXT_PRESERVE_IMAGES, which would decode every image just to skip it
+_TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# cv2 conversion to BGR for each pixmap channel count
+_TO_BGR = {
+    1: cv2.COLOR_GRAY2BGR,
+    3: cv2.COLOR_RGB2BGR,
+    4: cv2.COLOR_RGBA2BGR
+}
+
+
+def render_page(page, dpi=72):
+    """
+    Rasterize a PDF page into a BGR array.
+    The pixmap buffer is wrapped without copying, so the BGR conversion is
+    the only allocation.
+    """
+    pix = page.get_pixmap(dpi=dpi, alpha=False)
+    image = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    return cv2.cvtColor(image, _TO_BGR[pix.n])
+
+
+def read_text_layer(page):
+    """
+    Return (boxes, image_coverage) for a page: one TextBox per line of its
+    embedded text layer, and the fraction of the page area covered by images
+    (overlapping images are counted twice, capped at 1.0). Image placements
+    come from get_image_info, which does not extract the image data.
+    """
+    boxes = []
+    for block in page.get_text('dict', flags=_TEXT_FLAGS)['blocks']:
+        for line in block.get('lines', []):
+            text = ''.join(span['text'] for span in line['spans']).strip()
+            if text:
+                x0, y0, x1, y1 = line['bbox']
+                boxes.append(TextBox(text, x0, y0, x1, y1))
+
+    image_area = sum((fitz.Rect(image['bbox']) & page.rect).get_area() for image in page.get_image_info())
+    page_area = page.rect.get_area()
+    return boxes, min(1.0, image_area / page_area) if page_area else 0.0
+
+
+def text_layer_boxes(page):
+    """Return one TextBox per line of the page's embedded text layer"""
+    return read_text_layer(page)[0]
+
+
+def _ocr_image(image):
+    """OCR an already rendered page inside an OCR worker"""
+    result = worker_ocr(image)
+    if not result or not result[0]:
+        return []
+    return boxes_from_paddle(result[0])
+
+
+def _ocr_file_page(pdf_path, page_number, dpi):
+    """Render and OCR a single page of a PDF on disk inside an OCR worker"""
+    # Opening by path only parses the page tree and the pages that are rendered
+    with fitz.open(pdf_path) as pdf_doc:
+        image = render_page(pdf_doc[page_number], dpi)
+    return _ocr_image(image)
+
+
+def iter_pdf_pages(pdf_doc, pdf_path, ocr_pool, dpi=72, min_text_chars=16, window=2,
+                   cache=None, cache_key=None, max_image_coverage=0.5, full_text_chars=200):
+    """
+    Yield (page_number, boxes) for every page of a PDF, in page order, where
+    boxes is a list of TextBox in that page's coordinates.
+
+    Pages with an embedded text layer of at least min_text_chars characters
+    are read directly. The others are OCR'd on the OCR pool, as are scans
+    that only carry a small text header or stamp: images cover
+    max_image_coverage or more of the page and the text layer is shorter
+    than full_text_chars (a complete text layer over a background image is
+    still read directly). When the PDF lives on disk (pdf_path) the worker
+    opens and renders the page itself, otherwise the page is rendered here
+    and only its pixels are sent. Up to `window` pages are scheduled
+    ahead of the consumer so workers stay busy while memory stays bounded.
+    Closing the generator early cancels pages that have not started yet.
+    When a ContentCache is given, OCR'd pages are stored under
+    "<cache_key>:<page_number>" and reused on later calls.
+    """
+    page_count = len(pdf_doc)
+    scheduled = deque()
+    next_page = 0
+
+    try:
+        while scheduled or next_page < page_count:
+            while next_page < page_count and len(scheduled) < window:
+                with metrics.stage('pdf_text_layer'):
+                    boxes, image_coverage = read_text_layer(pdf_doc[next_page])
+                text_chars = sum(len(box.text) for box in boxes)
+                if text_chars >= min_text_chars and (image_coverage < max_image_coverage
+                                                     or text_chars >= full_text_chars):
+                    scheduled.append((next_page, boxes))
+                    next_page += 1
+                    continue
+
+                cached = cache.get(f"{cache_key}:{next_page}") if cache is not None else None
+                if cached is not None:
+                    scheduled.append((next_page, cached))
+                else:
+                    if pdf_path:
+                        future = ocr_pool.submit(_ocr_file_page, pdf_path, next_page, dpi)
+                    else:
+                        with metrics.stage('pdf_page_render'):
+                            image = render_page(pdf_doc[next_page], dpi)
+                        future = ocr_pool.submit(_ocr_image, image)
+                    scheduled.append((next_page, future))
+                next_page += 1
+
+            page_number, boxes = scheduled.popleft()
+            if isinstance(boxes, Future):
+                with metrics.stage('pdf_page_ocr'):
+                    boxes = boxes.result()
+                if cache is not None:
+                    cache.put(f"{cache_key}:{page_number}", boxes)
+            yield page_number, boxes
+
+    finally:
+        for _, boxes in scheduled:
+            if isinstance(boxes, Future):
+                boxes.cancel()
@@ -0,0 +1,115 @@
+import bisect
+import itertools
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from executors import QueueFullError
+from metrics import metrics
+
+# priority: lower runs first; limit: concurrent requests of this class;
+# deadline: seconds a request may wait for a slot (None = no limit);
+# max_queue: requests of this class allowed to wait at once
+Workload = namedtuple('Workload', ['name', 'priority', 'limit', 'deadline', 'max_queue'])
+
+_CLASS_DEADLINE = object()
+
+
+class DeadlineExceededError(QueueFullError):
+    """Raised when a request waited longer than its class deadline for a slot"""
+
+    status_code = 503
+
+
+class AdmissionScheduler:
+    """
+    Priority admission control in front of the face and OCR endpoints.
+    At most capacity admitted requests run at once, and at most limit per
+    workload class. When a slot frees up it goes to the waiting request with
+    the best (priority, arrival) whose class is below its limit, so a burst of
+    bulk work never delays interactive requests beyond a free slot. Requests
+    that cannot queue are refused with QueueFullError (429); requests that
+    wait past their class deadline are shed with DeadlineExceededError (503).
+    """
+
+    def __init__(self, workloads, capacity, retry_after=1):
+        self.workloads = {workload.name: workload for workload in workloads}
+        self.capacity = capacity
+        self.retry_after = retry_after
+        self._condition = threading.Condition()
+        self._sequence = itertools.count()
+        self._waiting = []
+        self._running = {name: 0 for name in self.workloads}
+        self._queued = {name: 0 for name in self.workloads}
+        self._total_running = 0
+
+    @contextmanager
+    def admit(self, name, deadline=_CLASS_DEADLINE):
+        """Hold a slot of workload class name for the duration of the block"""
+        self.acquire(name, deadline)
+        try:
+            yield
+        finally:
+            self.release(name)
+
+    def acquire(self, name, deadline=_CLASS_DEADLINE):
+        workload = self.workloads[name]
+        if deadline is _CLASS_DEADLINE:
+            deadline = workload.deadline
+        start = time.monotonic()
+
+        with self._condition:
+            if self._queued[name] >= workload.max_queue:
+                metrics.inc('requests_shed_total', help='Requests refused by admission control',
+                            workload=name, reason='queue_full')
+                raise QueueFullError(self.retry_after)
+
+            entry = (workload.priority, next(self._sequence), name)
+            bisect.insort(self._waiting, entry)
+            self._queued[name] += 1
+            try:
+                while self._next_eligible() != entry:
+                    remaining = None if deadline is None else deadline - (time.monotonic() - start)
+                    if remaining is not None and remaining <= 0:
+                        metrics.inc('requests_shed_total', help='Requests refused by admission control',
+                                    workload=name, reason='deadline')
+                        raise DeadlineExceededError(self.retry_after)
+                    self._condition.wait(remaining)
+            finally:
+                self._waiting.remove(entry)
+                self._queued[name] -= 1
+                # Whether admitted or shed, the head of the queue may have changed
+                self._condition.notify_all()
+
+            self._running[name] += 1
+            self._total_running += 1
+
+        metrics.record_stage('admission_wait', time.monotonic() - start)
+
+    def release(self, name):
+        with self._condition:
+            self._running[name] -= 1
+            self._total_running -= 1
+            self._condition.notify_all()
+
+    def stats(self):
+        """Return {class: {'running', 'queued', 'limit'}}"""
+        with self._condition:
+            return {
+                name: {
+                    'running': self._running[name],
+                    'queued': self._queued[name],
+                    'limit': workload.limit
+                }
+                for name, workload in self.workloads.items()
+            }
+
+    def _next_eligible(self):
+        """The best waiting entry that could run now, or None"""
+        if self._total_running >= self.capacity:
+            return None
+        for entry in self._waiting:
+            name = entry[2]
+            if self._running[name] < self.workloads[name].limit:
+                return entry
+        return None
@@ -0,0 +1,48 @@
+import threading
+from concurrent.futures import Future
+from metrics import metrics
+
+
+class SingleFlight:
+    """
+    Coalesce identical in-flight calls.
+    Calls are keyed by endpoint plus the content digests of their uploads;
+    while one call for a key is running, later callers with the same key wait
+    for it and share its result (or exception) instead of redoing the work.
+    Nothing is kept once the call completes, so this is not a cache.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, endpoint, digests, fn, *args):
+        key = (endpoint,) + tuple(digests)
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            metrics.inc('coalesced_requests_total', help='Requests that shared an identical in-flight computation',
+                        endpoint=endpoint)
+            return future.result()
+
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            self._finish(key)
+            future.set_exception(e)
+            raise
+        self._finish(key)
+        future.set_result(result)
+        return result
+
+    @property
+    def in_flight(self):
+        return len(self._calls)
+
+    def _finish(self, key):
+        with self._lock:
+            del self._calls[key]
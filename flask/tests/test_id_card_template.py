@@ -0,0 +1,91 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+
+from id_card_template import CARD_HEIGHT, CARD_WIDTH, CNIE_REGIONS, crop_regions, template_lines
+from id_processor import IDCardProcessor
+
+# What recognition returns for each region of a well-aligned CNIE
+FIELD_TEXTS = {
+    'first_name': 'AMINA',
+    'last_name': 'EL IDRISSI',
+    'date_of_birth': 'Ne le 12.03.1990',
+    'place_of_birth': 'à CASABLANCA',
+    'expiry_date': "Valable jusqu'au 01.02.2031",
+    'card_number': 'BE123456',
+    'father_name': 'Fils de MOHAMED',
+    'mother_name': 'et de FATIMA',
+    'civil_status_number': '123/1990',
+    'address': 'Adresse 12 RUE ALLAL BEN ABDELLAH CASABLANCA',
+    'gender': 'Sexe F'
+}
+
+
+def synthetic_card(side):
+    """A normalized card whose field regions are each painted a distinct gray level"""
+    card = np.zeros((CARD_HEIGHT, CARD_WIDTH, 3), dtype=np.uint8)
+    for index, (_, (x0, y0, x1, y1)) in enumerate(CNIE_REGIONS[side]):
+        card[int(y0 * CARD_HEIGHT):int(y1 * CARD_HEIGHT), int(x0 * CARD_WIDTH):int(x1 * CARD_WIDTH)] = 20 * (index + 1)
+    return card
+
+
+def recognize(card, side):
+    """Stand-in for recognize_crops: read back the region each crop came from"""
+    levels = {20 * (index + 1): field for index, (field, _) in enumerate(CNIE_REGIONS[side])}
+    crops = crop_regions(card, side)
+    recognized = []
+    for _, crop in crops:
+        values = np.unique(crop)
+        assert len(values) == 1, "crop overlaps another region or the background"
+        recognized.append((FIELD_TEXTS[levels[int(values[0])]], 0.95))
+    return [field for field, _ in crops], recognized
+
+
+@pytest.mark.parametrize('side', ['front', 'back'])
+def test_crop_regions_follow_the_template(side):
+    crops = crop_regions(synthetic_card(side), side)
+
+    assert [field for field, _ in crops] == [field for field, _ in CNIE_REGIONS[side]]
+    for (_, (x0, y0, x1, y1)), (_, crop) in zip(CNIE_REGIONS[side], crops):
+        assert crop.shape == (int(y1 * CARD_HEIGHT) - int(y0 * CARD_HEIGHT),
+                              int(x1 * CARD_WIDTH) - int(x0 * CARD_WIDTH), 3)
+        assert crop.flags['C_CONTIGUOUS']
+
+
+def test_template_lines_parse_into_the_card_fields():
+    front = template_lines(*recognize(synthetic_card('front'), 'front'), 0.7)
+    back = template_lines(*recognize(synthetic_card('back'), 'back'), 0.7)
+
+    result = IDCardProcessor().process_id_card(front, back)
+
+    assert result['success'], result.get('missing_fields')
+    assert result['data']['first_name'] == 'AMINA'
+    assert result['data']['last_name'] == 'EL IDRISSI'
+    assert result['data']['date_of_birth'] == '12.03.1990'
+    assert result['data']['expiry_date'] == '01.02.2031'
+    assert result['data']['place_of_birth'] == 'CASABLANCA'
+    assert result['data']['id_number'] == 'BE123456'
+    assert result['data']['father_name'] == 'MOHAMED'
+    assert result['data']['mother_name'] == 'FATIMA'
+    assert result['data']['civil_status_number'] == '123/1990'
+    assert result['data']['address'] == '12 RUE ALLAL BEN ABDELLAH CASABLANCA'
+    assert result['data']['gender'] == 'F'
+
+
+def test_template_lines_reject_a_misfit():
+    fields, recognized = recognize(synthetic_card('front'), 'front')
+
+    low_confidence = list(recognized)
+    low_confidence[0] = (low_confidence[0][0], 0.4)
+    assert template_lines(fields, low_confidence, 0.7) is None
+
+    # A date region that read a name means the card is misaligned
+    shifted = list(recognized)
+    shifted[fields.index('date_of_birth')] = ('EL IDRISSI', 0.95)
+    assert template_lines(fields, shifted, 0.7) is None
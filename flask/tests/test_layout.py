@@ -0,0 +1,69 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from layout import FieldPairer, TextBox, group_rows
+
+LABELS = [
+    ("Marque", ["marque"]),
+    ("Genre", ["genre"]),
+    ("Modele", ["modele"]),
+    ("Numero d'immatriculation", ["numero d'immatriculation"]),
+    ("Type carburant", ["type carburant"]),
+    ("N du chassis", ["n du chassis"]),
+    ("Adresse", ["adresse"]),
+    ("Fin de validite", ["fin de validite"])
+]
+
+VALUES = {
+    "Marque": "RENAULT",
+    "Genre": "VP",
+    "Modele": "CLIO",
+    "Numero d'immatriculation": "12345-A-6",
+    "Type carburant": "DIESEL",
+    "N du chassis": "VF1RJA00123456789",
+    "Adresse": "12 RUE ALLAL BEN ABDELLAH CASABLANCA",
+    "Fin de validite": "01.01.2030"
+}
+
+
+def _box(text, x0, baseline):
+    # Roughly the extent cv2.putText draws at scale 0.9 (about 18 px per character)
+    return TextBox(text, x0, baseline - 22, x0 + 18 * len(text), baseline + 4)
+
+
+def _two_column_page():
+    """Labels in a column at x=40 and values in a column at x=520, one row each"""
+    boxes = []
+    for index, (label, value) in enumerate(VALUES.items()):
+        baseline = 70 + index * 80
+        boxes.append(_box(label, 40, baseline))
+        boxes.append(_box(value, 520, baseline))
+    return boxes
+
+
+def test_label_column_pairs_with_value_column():
+    assert FieldPairer(LABELS).pair(_two_column_page()) == VALUES
+
+
+def test_inline_value_wins_over_neighbours():
+    boxes = [_box("Marque: PEUGEOT", 40, 70), _box("ignored", 520, 70)]
+    assert FieldPairer(LABELS).pair(boxes) == {"Marque": "PEUGEOT"}
+
+
+def test_right_value_stops_at_next_label():
+    boxes = [_box("Marque", 40, 70), _box("Genre", 300, 70), _box("VP", 520, 70)]
+    assert FieldPairer(LABELS).pair(boxes) == {"Genre": "VP"}
+
+
+def test_value_below_label():
+    boxes = [_box("Adresse", 40, 70), _box("12 RUE ALLAL", 40, 110), _box("CASABLANCA", 40, 150)]
+    pairer = FieldPairer(LABELS, rows_below={"Adresse": 3})
+    assert pairer.pair(boxes) == {"Adresse": "12 RUE ALLAL CASABLANCA"}
+
+
+def test_group_rows_orders_top_to_bottom_left_to_right():
+    rows = group_rows(_two_column_page())
+    assert len(rows) == len(VALUES)
+    assert [box.text for box in rows[0]] == ["Marque", "RENAULT"]
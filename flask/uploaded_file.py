@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import threading
+import cv2
+import numpy as np
+import fitz
+from werkzeug.utils import secure_filename
+from content_cache import content_hash, file_hash
+from metrics import metrics
+
+
+class UploadedFile:
+    """
+    An uploaded file kept in memory, or in a temporary file when it was too
+    large to buffer. Images and PDFs are decoded straight from the buffer.
+    """
+
+    def __init__(self, filename, data=None, path=None, owns_path=False):
+        self.filename = filename
+        self.extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+        self.path = path
+        self._data = data
+        self._owns_path = owns_path
+        self._digest = None
+        self._image = None
+        self._decode_lock = threading.Lock()
+
+    @classmethod
+    def from_path(cls, path):
+        """Wrap a file that already lives on disk (it is never deleted by close())"""
+        return cls(os.path.basename(path), path=path)
+
+    @property
+    def is_pdf(self):
+        return self.extension == 'pdf'
+
+    @property
+    def in_memory(self):
+        return self._data is not None
+
+    @property
+    def size(self):
+        if self._data is not None:
+            return len(self._data)
+        return os.path.getsize(self.path)
+
+    @property
+    def digest(self):
+        """Content hash of the raw upload, computed once"""
+        if self._digest is None:
+            self._digest = content_hash(self._data) if self._data is not None else file_hash(self.path)
+        return self._digest
+
+    def read_bytes(self):
+        """Return the raw file contents"""
+        if self._data is not None:
+            return self._data
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def decode_image(self):
+        """Decode the upload into a BGR array, reusing it on later calls"""
+        # Locked so concurrent consumers of the same upload decode it only once
+        with self._decode_lock:
+            if self._image is None:
+                with metrics.stage('image_decode'):
+                    if self._data is not None:
+                        buffer = np.frombuffer(self._data, dtype=np.uint8)
+                        image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+                    else:
+                        image = cv2.imread(self.path)
+
+                if image is None:
+                    raise ValueError(f"Could not read image {self.filename}")
+                self._image = image
+            return self._image
+
+    def open_pdf(self):
+        """Open the upload as a PyMuPDF document without writing it to disk"""
+        if self._data is not None:
+            return fitz.open(stream=self._data, filetype='pdf')
+        return fitz.open(self.path)
+
+    def close(self):
+        """Release the decoded image and remove any spooled temporary file"""
+        self._image = None
+        if self._owns_path and self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def read_upload(file, spool_threshold, spool_dir):
+    """
+    Read a werkzeug FileStorage into an UploadedFile.
+    Uploads up to spool_threshold bytes stay in memory; larger ones are
+    streamed into a uniquely named temporary file inside spool_dir.
+    """
+    filename = secure_filename(file.filename)
+    head = file.stream.read(spool_threshold + 1)
+
+    if len(head) <= spool_threshold:
+        return UploadedFile(filename, data=head)
+
+    extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'bin'
+    fd, path = tempfile.mkstemp(suffix=f".{extension}", dir=spool_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(head)
+            shutil.copyfileobj(file.stream, out)
+    except Exception:
+        os.remove(path)
+        raise
+
+    return UploadedFile(filename, path=path, owns_path=True)
@@ -0,0 +1,76 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """
+    Runs model loading/warmup steps once and reports readiness.
+    Steps run in order, either in a background thread (start) or in the
+    calling thread (run); later calls are no-ops while they run or after
+    they succeeded. A failed run is released so the next call retries,
+    skipping the steps that already completed.
+    """
+
+    def __init__(self, steps):
+        self.steps = steps
+        self.ready = False
+        self.error = None
+        self._durations = {}
+        self._started = False
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def start(self):
+        """Begin warming up in a daemon thread"""
+        if self._claim():
+            threading.Thread(target=self._run, name='warmup', daemon=True).start()
+
+    def run(self):
+        """Warm up in the calling thread, waiting for a run already in progress"""
+        if self._claim():
+            self._run()
+        else:
+            with self._lock:
+                done = self._done
+            done.wait()
+
+    def status(self):
+        return {
+            'ready': self.ready,
+            'started': self._started,
+            'error': self.error,
+            'durations_ms': dict(self._durations)
+        }
+
+    def _claim(self):
+        with self._lock:
+            if self._started:
+                return False
+            self._started = True
+            # Each attempt gets its own event; waiters of a failed one keep theirs
+            self._done = threading.Event()
+            return True
+
+    def _run(self):
+        done = self._done
+        try:
+            for name, step in self.steps:
+                if name in self._durations:
+                    continue
+                start = time.perf_counter()
+                step()
+                self._durations[name] = round((time.perf_counter() - start) * 1000, 2)
+                logger.info(f"Warmup step {name} done in {self._durations[name]} ms")
+            self.error = None
+            self.ready = True
+        except Exception as e:
+            self.error = str(e)
+            logger.error(f"Warmup failed: {str(e)}", exc_info=True)
+            with self._lock:
+                self._started = False
+        finally:
+            # A retry may already have replaced self._done
+            done.set()
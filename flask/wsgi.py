@@ -0,0 +1,11 @@
+from face_comparator import load_face_models
+from main import app
+
+# Under gunicorn's preload_app this module is imported once in the master, so
+# the dlib models are loaded before forking and shared copy-on-write by every
+# worker. The OCR pool is started per worker after the fork (see
+# gunicorn.conf.py): its executor threads and child processes do not survive
+# a fork.
+load_face_models()
+
+application = app
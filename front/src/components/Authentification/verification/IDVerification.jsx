@@ -233,8 +233,8 @@ const IDVerification = ({ frontID, backID, onVerificationComplete, userInfo, onF
   
       // Process extracted text into structured data
       const extractedData = processExtractedText(
-        frontTextResult.extracted_text,
-        backTextResult.extracted_text
+        frontTextResult.lines,
+        backTextResult.lines
       );
       
       if (!extractedData.success) {